@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+Per-frame preprocessing micro-benchmark.
+
+Compares the original load_image path (full-resolution decode, float64
+conversion, separate ToTensor/Normalize-style pass) with model/preprocess.py
+(draft-mode JPEG decode, uint8 resize, fused float32 normalize into a reused
+batch buffer) on synthetic 720p and 1080p camera frames.
+
+    python benchmarks/preprocess_bench.py [--iterations 200] [--json]
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "model"))
+
+from preprocess import decode_rgb, normalize_batch  # noqa: E402
+
+RESOLUTIONS = {"720p": (1280, 720), "1080p": (1920, 1080)}
+
+_MEAN = np.array([0.485, 0.456, 0.406])
+_STD = np.array([0.229, 0.224, 0.225])
+
+
+def synthetic_frame(width, height, seed=0, quality=85):
+    """A camera-like JPEG: smooth gradients and shapes plus sensor noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    r = 128 + 100 * np.sin(x / (width / 6.0) + seed)
+    g = 128 + 100 * np.cos(y / (height / 4.0))
+    b = 128 + 100 * np.sin((x + y) / (width / 3.0))
+    img = np.stack([r, g, b], axis=-1) + rng.normal(0, 8, (height, width, 3))
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(img, 0, 255).astype(np.uint8)).save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def legacy_preprocess(data):
+    """The original path: load_image() followed by ToTensor() + Normalize()."""
+    img = Image.open(io.BytesIO(data))
+    img = img.resize((224, 224))
+    img_array = np.array(img) / 255.0
+    if len(img_array.shape) == 2:
+        img_array = np.stack((img_array,) * 3, axis=-1)
+    if img_array.shape[2] == 4:
+        img_array = img_array[:, :, :3]
+    tensor = ((img_array - _MEAN) / _STD).transpose(2, 0, 1).astype(np.float32)
+    return tensor[np.newaxis]
+
+
+def fast_preprocess(data):
+    return normalize_batch([decode_rgb(data)], "pytorch")
+
+
+def time_per_frame(fn, data, iterations):
+    fn(data)
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn(data)
+        samples.append(time.perf_counter_ns() - start)
+    samples = np.array(samples) / 1e6
+    return {
+        "mean_ms": float(samples.mean()),
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name, (width, height) in RESOLUTIONS.items():
+        data = synthetic_frame(width, height)
+        legacy = time_per_frame(legacy_preprocess, data, args.iterations)
+        fast = time_per_frame(fast_preprocess, data, args.iterations)
+        results[name] = {
+            "jpeg_bytes": len(data),
+            "legacy": legacy,
+            "fast": fast,
+            "speedup": legacy["mean_ms"] / fast["mean_ms"],
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'frame':<8}{'legacy ms':>12}{'fast ms':>12}{'speedup':>10}")
+    for name, result in results.items():
+        print(f"{name:<8}{result['legacy']['mean_ms']:>12.2f}{result['fast']['mean_ms']:>12.2f}"
+              f"{result['speedup']:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+"""
+End-to-end latency and throughput benchmark for model/infer.py.
+
+Drives the inference script the way the server does, offline and with
+synthetic camera frames, so results are reproducible between commits:
+
+    cli    one `infer.py - --timings` process per frame (the one-shot path)
+    serve  one `infer.py --serve` worker under a closed-loop concurrency sweep
+
+Each point reports p50/p95/p99 latency, frames/sec, the worker's peak RSS and
+the mean per-stage times the script reports (decode, preprocess, forward,
+serialize, plus queue/load where they apply). The default dummy backend needs
+no deep learning framework, so the suite also runs in CI.
+
+    python benchmarks/run_benchmarks.py [--backend dummy] [--quick] [--output results.json]
+    python benchmarks/run_benchmarks.py --compare baseline.json [--fail-threshold 10]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from preprocess_bench import synthetic_frame
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+INFER_SCRIPT = os.path.join(ROOT, "model", "infer.py")
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720), "1080p": (1920, 1080)}
+
+# Distinct frames cycled through per resolution, so a result cache cannot skew the numbers
+DISTINCT_FRAMES = 8
+
+
+def percentiles(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        "mean_ms": round(float(samples.mean()), 3),
+        "p50_ms": round(float(np.percentile(samples, 50)), 3),
+        "p95_ms": round(float(np.percentile(samples, 95)), 3),
+        "p99_ms": round(float(np.percentile(samples, 99)), 3),
+    }
+
+
+def mean_stages(timings):
+    """[{"decode_ms": ...}, ...] -> {"decode_ms": mean, ...} over the responses that have each stage."""
+    stages = {}
+    for entry in timings:
+        for stage, value in entry.items():
+            stages.setdefault(stage, []).append(value)
+    return {stage: round(float(np.mean(values)), 3) for stage, values in stages.items()}
+
+
+def peak_rss_mb(pid):
+    """High-water RSS of a running process, from /proc (None where unavailable)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024.0, 1)
+    except OSError:
+        pass
+    return None
+
+
+def reap(process):
+    """Wait for a child and return its peak RSS in MB from its own rusage."""
+    if hasattr(os, "wait4"):
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        # ru_maxrss is in KB on Linux
+        return round(usage.ru_maxrss / 1024.0, 1)
+    process.wait()
+    return None
+
+
+def worker_args(args):
+    return ["--backend", args.backend] + (["--quantize", args.quantize] if args.quantize else [])
+
+
+def bench_cli(frames, args):
+    """One process per frame: latency includes interpreter start and model load."""
+    latencies, timings, rss = [], [], []
+    started = time.perf_counter()
+    for i in range(args.cli_frames):
+        start = time.perf_counter_ns()
+        process = subprocess.Popen([sys.executable, INFER_SCRIPT, "-", "--timings"] + worker_args(args),
+                                   stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   stderr=subprocess.DEVNULL)
+        process.stdin.write(frames[i % len(frames)])
+        process.stdin.close()
+        output = process.stdout.read()
+        rss.append(reap(process))
+        latencies.append((time.perf_counter_ns() - start) / 1e6)
+
+        result = json.loads(output)
+        if "error" in result:
+            raise RuntimeError(f"infer.py failed: {result['error']}")
+        timings.append(result.get("timings", {}))
+    elapsed = time.perf_counter() - started
+
+    rss = [value for value in rss if value is not None]
+    return {
+        "frames": args.cli_frames,
+        "latency": percentiles(latencies),
+        "fps": round(args.cli_frames / elapsed, 2),
+        "peak_rss_mb": max(rss) if rss else None,
+        "stages_ms": mean_stages(timings),
+    }
+
+
+class ServeClient:
+    """A --serve worker with a reader thread; send() blocks while `window` requests are in flight."""
+
+    def __init__(self, args):
+        command = [sys.executable, INFER_SCRIPT, "--serve",
+                   "--max-batch-size", str(args.max_batch_size),
+                   "--max-wait-ms", str(args.max_wait_ms)] + worker_args(args)
+        if args.threads:
+            command += ["--threads", str(args.threads)]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.DEVNULL)
+        ready = json.loads(self.process.stdout.readline() or "{}")
+        if not ready.get("ready"):
+            raise RuntimeError(f"Worker failed to start: {ready.get('error', 'no ready line')}")
+        self.ready = ready
+        self._sent = {}
+        self._responses = []
+        self._lock = threading.Lock()
+        self._window = None
+        self._next_id = 0
+        self._reader = threading.Thread(target=self._read, daemon=True)
+        self._reader.start()
+
+    def run(self, frames, count, concurrency):
+        """Send count frames keeping `concurrency` in flight; return (responses, elapsed seconds)."""
+        self._window = threading.Semaphore(concurrency)
+        with self._lock:
+            self._responses = []
+        started = time.perf_counter()
+        for i in range(count):
+            self._window.acquire()
+            self._send(frames[i % len(frames)])
+        # Wait for the stragglers
+        for _ in range(concurrency):
+            self._window.acquire()
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            return list(self._responses), elapsed
+
+    def _send(self, frame):
+        self._next_id += 1
+        header = json.dumps({"id": self._next_id, "size": len(frame), "timings": True})
+        with self._lock:
+            self._sent[self._next_id] = time.perf_counter_ns()
+        self.process.stdin.write(header.encode() + b"\n" + frame)
+        self.process.stdin.flush()
+
+    def _read(self):
+        for line in self.process.stdout:
+            received = time.perf_counter_ns()
+            response = json.loads(line)
+            with self._lock:
+                sent = self._sent.pop(response.get("id"), received)
+                self._responses.append(((received - sent) / 1e6, response))
+            self._window.release()
+
+    def close(self):
+        rss = peak_rss_mb(self.process.pid)
+        self.process.stdin.close()
+        reaped = reap(self.process)
+        return rss if rss is not None else reaped
+
+
+def bench_serve(frames, args):
+    """A concurrency sweep against one long-lived worker."""
+    client = ServeClient(args)
+    points = []
+    try:
+        for concurrency in args.concurrency:
+            # Warm the batch path at this concurrency before measuring it
+            client.run(frames, max(concurrency, 4), concurrency)
+            responses, elapsed = client.run(frames, args.serve_frames, concurrency)
+
+            errors = [r["error"] if "error" in r else r["result"]["error"]
+                      for _, r in responses if "error" in r or "error" in r.get("result", {})]
+            if errors:
+                raise RuntimeError(f"Worker failed: {errors[0]}")
+            points.append({
+                "concurrency": concurrency,
+                "frames": len(responses),
+                "latency": percentiles([latency for latency, _ in responses]),
+                "fps": round(len(responses) / elapsed, 2),
+                "mean_batch_size": round(float(np.mean([r["batch_size"] for _, r in responses])), 2),
+                "stages_ms": mean_stages([r.get("timings", {}) for _, r in responses]),
+            })
+    finally:
+        rss = client.close()
+    for point in points:
+        point["peak_rss_mb"] = rss
+    return client.ready, points
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+        return {"commit": commit, "dirty": bool(dirty)}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def metadata(args):
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "config": {
+            "backend": args.backend,
+            "quantize": args.quantize,
+            "modes": args.modes,
+            "resolutions": args.resolutions,
+            "concurrency": args.concurrency,
+            "cli_frames": args.cli_frames,
+            "serve_frames": args.serve_frames,
+            "max_batch_size": args.max_batch_size,
+            "max_wait_ms": args.max_wait_ms,
+            "threads": args.threads,
+        },
+    }
+
+
+def point_key(point):
+    return (point["mode"], point["resolution"], point.get("concurrency"))
+
+
+def compare(results, baseline, threshold=None):
+    """Print fps and latency deltas against a baseline run; return the regressed points."""
+    previous = {point_key(point): point for point in baseline["results"]}
+    regressions = []
+    print(f"\nvs {baseline['metadata']['git'].get('commit') or 'baseline'}")
+    print(f"{'mode':<7}{'res':<7}{'conc':>5}{'fps':>10}{'delta':>9}{'p95 ms':>10}{'delta':>9}")
+    for point in results:
+        old = previous.get(point_key(point))
+        if old is None:
+            continue
+        fps_delta = (point["fps"] / old["fps"] - 1.0) * 100.0 if old["fps"] else 0.0
+        p95, old_p95 = point["latency"]["p95_ms"], old["latency"]["p95_ms"]
+        p95_delta = (p95 / old_p95 - 1.0) * 100.0 if old_p95 else 0.0
+        print(f"{point['mode']:<7}{point['resolution']:<7}{point.get('concurrency') or '-':>5}"
+              f"{point['fps']:>10.1f}{fps_delta:>+8.1f}%{p95:>10.1f}{p95_delta:>+8.1f}%")
+        if threshold is not None and (fps_delta < -threshold or p95_delta > threshold):
+            regressions.append(point_key(point))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'mode':<7}{'res':<7}{'conc':>5}{'fps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'rss MB':>9}  stages (mean ms)")
+    for point in results:
+        latency = point["latency"]
+        stages = " ".join(f"{stage[:-3]}={value:.2f}" for stage, value in point["stages_ms"].items())
+        rss = point["peak_rss_mb"]
+        print(f"{point['mode']:<7}{point['resolution']:<7}{point.get('concurrency') or '-':>5}"
+              f"{point['fps']:>10.1f}{latency['p50_ms']:>10.1f}{latency['p95_ms']:>10.1f}"
+              f"{latency['p99_ms']:>10.1f}{rss if rss is not None else '-':>9}  {stages}")
+
+
+def parse_list(value, cast=str):
+    return [cast(part) for part in value.split(",") if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--backend", default="dummy",
+                        help="infer.py --backend (default: dummy, which needs no framework)")
+    parser.add_argument("--quantize", help="infer.py --quantize")
+    parser.add_argument("--modes", type=parse_list, default=["cli", "serve"],
+                        help="Comma-separated paths to drive: cli, serve")
+    parser.add_argument("--resolutions", type=parse_list, default=list(RESOLUTIONS),
+                        help=f"Comma-separated frame sizes out of {', '.join(RESOLUTIONS)}")
+    parser.add_argument("--concurrency", type=lambda v: parse_list(v, int), default=[1, 4, 16],
+                        help="Comma-separated in-flight request counts for the serve sweep")
+    parser.add_argument("--cli-frames", type=int, default=20, help="Processes to start per resolution")
+    parser.add_argument("--serve-frames", type=int, default=200,
+                        help="Frames to send per concurrency point")
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--threads", type=int, help="infer.py --threads for the serve worker")
+    parser.add_argument("--quick", action="store_true",
+                        help="Smoke-test sizes: 720p only, 3 CLI frames, 40 frames per point")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --output to diff against")
+    parser.add_argument("--fail-threshold", type=float,
+                        help="With --compare, exit 1 if fps drops or p95 grows by more than this %%")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.resolutions, args.cli_frames, args.serve_frames = ["720p"], 3, 40
+    unknown = [name for name in args.resolutions if name not in RESOLUTIONS]
+    if unknown:
+        parser.error(f"Unknown resolution: {', '.join(unknown)}")
+
+    results = []
+    worker = None
+    for name in args.resolutions:
+        width, height = RESOLUTIONS[name]
+        frames = [synthetic_frame(width, height, seed=seed) for seed in range(DISTINCT_FRAMES)]
+        if "cli" in args.modes:
+            results.append({"mode": "cli", "resolution": name, **bench_cli(frames, args)})
+        if "serve" in args.modes:
+            worker, points = bench_serve(frames, args)
+            results.extend({"mode": "serve", "resolution": name, **point} for point in points)
+
+    report = {"metadata": metadata(args), "results": results}
+    if worker:
+        report["metadata"]["worker"] = {key: value for key, value in worker.items()
+                                        if key not in ("ready", "pid")}
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.fail_threshold)
+        if regressions:
+            print(f"\n{len(regressions)} point(s) regressed by more than {args.fail_threshold}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
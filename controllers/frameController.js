@@ -1,110 +1,336 @@
-const { spawn } = require('child_process');
-const fs = require('fs');
-const path = require('path');
+const WorkerPool = require('../lib/workerPool');
+const { Histogram, Counter, sample, elapsedMs } = require('../lib/metrics');
+const { uploadItems } = require('../lib/uploadStream');
+
+// Long-lived Python processes keep the model loaded between frames
+const workerPool = new WorkerPool({
+  size: parseInt(process.env.INFERENCE_WORKERS, 10) || undefined,
+  threadsPerWorker: parseInt(process.env.INFERENCE_THREADS_PER_WORKER, 10) || undefined,
+  pinCpus: process.env.INFERENCE_PIN_CPUS !== undefined ? process.env.INFERENCE_PIN_CPUS !== '0' : undefined,
+  maxBatchSize: parseInt(process.env.INFERENCE_MAX_BATCH_SIZE, 10) || 16,
+  maxWaitMs: process.env.INFERENCE_MAX_WAIT_MS !== undefined ? parseFloat(process.env.INFERENCE_MAX_WAIT_MS) : 5,
+  cacheSize: process.env.INFERENCE_CACHE_SIZE !== undefined ? parseInt(process.env.INFERENCE_CACHE_SIZE, 10) : 256,
+  cacheTtl: parseFloat(process.env.INFERENCE_CACHE_TTL) || undefined,
+  cacheMode: process.env.INFERENCE_CACHE_MODE,
+  backend: process.env.INFERENCE_BACKEND,
+  quantize: process.env.INFERENCE_QUANTIZE,
+  weights: process.env.INFERENCE_WEIGHTS,
+  model: process.env.INFERENCE_MODEL,
+  models: process.env.INFERENCE_MODELS,
+  memoryBudgetMb: parseFloat(process.env.INFERENCE_MEMORY_BUDGET_MB) || undefined,
+  warmup: process.env.INFERENCE_WARMUP !== '0',
+  topK: parseInt(process.env.INFERENCE_TOP_K, 10) || 5,
+  sceneThreshold: process.env.INFERENCE_SCENE_THRESHOLD !== undefined ? parseFloat(process.env.INFERENCE_SCENE_THRESHOLD) : undefined,
+  maxStalenessMs: process.env.INFERENCE_MAX_STALENESS_MS !== undefined ? parseFloat(process.env.INFERENCE_MAX_STALENESS_MS) : undefined
+});
+
+// Every frame's stage times, from both the server and the worker, aggregated for /api/metrics
+const stageDurations = new Histogram('inference_stage_duration_seconds',
+  'Time spent in each stage of a frame: base64_decode, decode, gate, cache, queue, preprocess, forward, serialize, parse, worker, total',
+  { labelName: 'stage' });
+const framesTotal = new Counter('inference_frames_total', 'Frames processed, by outcome', 'outcome');
+const modelFrames = new Counter('inference_model_frames_total', 'Frames answered, by model', 'model');
+
+// Frames of one streamed upload processed at once; reading the body pauses while all are busy
+const STREAM_MAX_IN_FLIGHT = parseInt(process.env.STREAM_MAX_IN_FLIGHT, 10) || 16;
 
 const frameController = {
   /**
    * Process a camera frame and run model inference
-   * @param {String} frameData - Base64 encoded image frame
+   * @param {String|Buffer} frameData - Base64 encoded image frame, or the raw image bytes
+   * @param {Object} [options]
+   * @param {Boolean} [options.timings] - Add per-stage times in ms to the result
+   * @param {Number} [options.topK] - Classes to list in the result's `top_k` (default: 1)
+   * @param {Boolean} [options.probabilities] - Add the full distribution as base64 packed float32
+   * @param {String} [options.stream] - Stream id; frames of a static scene reuse the last result
+   * @param {String} [options.model] - Registry model to run (default: the workers' default model)
    * @returns {Promise<Object>} - Inference result
    */
-  processFrame: async (frameData) => {
+  processFrame: async (frameData, options = {}) => {
     try {
-      // Create a temporary file path for the frame
-      const tempFramePath = path.join(__dirname, '../temp', `frame-${Date.now()}.jpg`);
-      
-      // Ensure temp directory exists
-      const tempDir = path.join(__dirname, '../temp');
-      if (!fs.existsSync(tempDir)) {
-        fs.mkdirSync(tempDir, { recursive: true });
-      }
+      const started = process.hrtime.bigint();
       
-      // Decode base64 and save frame to file
-      const buffer = Buffer.from(frameData.replace(/^data:image\/\w+;base64,/, ''), 'base64');
-      fs.writeFileSync(tempFramePath, buffer);
+      // Decode base64; the bytes are piped straight to the worker
+      const encoded = !Buffer.isBuffer(frameData);
+      const buffer = encoded
+        ? Buffer.from(frameData.replace(/^data:image\/\w+;base64,/, ''), 'base64')
+        : frameData;
+      const decodeMs = elapsedMs(started);
       
-      // Call the Python inference script
-      const result = await runInference(tempFramePath);
+      // Call the Python inference worker
+      const { timings: workerTimings, ...result } = await runInference(buffer, {
+        topK: parseInt(options.topK, 10) || 1,
+        probabilities: Boolean(options.probabilities),
+        stream: options.stream,
+        // Anything but a name (e.g. a repeated ?model= query parameter) selects the default model
+        model: typeof options.model === 'string' && options.model ? options.model : undefined
+      });
       
-      // Clean up the temporary file
-      fs.unlinkSync(tempFramePath);
+      const timings = {
+        ...(encoded ? { base64_decode_ms: decodeMs } : {}),
+        ...workerTimings,
+        total_ms: elapsedMs(started)
+      };
+      for (const [stage, ms] of Object.entries(timings)) {
+        stageDurations.observe(stage.replace(/_ms$/, ''), ms / 1000);
+      }
+      framesTotal.inc(result.error ? 'error' : result.reused ? 'reused' : 'ok');
+      if (result.model) {
+        modelFrames.inc(result.model);
+      }
       
+      if (options.timings) {
+        result.timings = timings;
+      }
       return result;
     } catch (error) {
+      framesTotal.inc('error');
       console.error('Error in processFrame:', error);
       throw error;
     }
   },
   
+  /**
+   * Forget a stream's scene-change state, e.g. when its connection closes
+   * @param {String} stream - Stream id passed to processFrame
+   */
+  releaseStream: (stream) => {
+    workerPool.release(stream);
+  },
+  
   /**
    * HTTP endpoint for handling frame uploads
    */
   handleFrameUpload: async (req, res) => {
     try {
-      const { frame } = req.body;
+      const { frame, timings, top_k: topK, probabilities, model } = req.body;
       if (!frame) {
         return res.status(400).json({ status: 'error', message: 'No frame data provided' });
       }
       
-      const result = await frameController.processFrame(frame);
-      
-      // Enhance the result with a more user-friendly message
-      let detectedObject = result.prediction || "unknown object";
-      let confidence = result.confidence ? (result.confidence * 100).toFixed(2) + "%" : "unknown";
+      const result = await frameController.processFrame(frame, { timings, topK, probabilities, model });
       
       return res.json({ 
         status: 'success', 
-        message: `Detected: ${detectedObject} (Confidence: ${confidence})`,
+        message: detectionMessage(result),
         data: result 
       });
     } catch (error) {
       console.error('Error handling frame upload:', error);
       return res.status(500).json({ status: 'error', message: error.message });
     }
-  }
-};
-
-/**
- * Run the Python inference script and return the results
- * @param {String} framePath - Path to the image file
- * @returns {Promise<Object>} - Parsed inference results
- */
-function runInference(framePath) {
-  return new Promise((resolve, reject) => {
-    // Launch the Python script
-    const pythonProcess = spawn('python', [
-      path.join(__dirname, '../model/infer.py'),
-      framePath
-    ]);
-    
-    let result = '';
-    
-    // Collect data from stdout
-    pythonProcess.stdout.on('data', (data) => {
-      result += data.toString();
-    });
+  },
+  
+  /**
+   * HTTP endpoint for streamed uploads of many frames
+   *
+   * The body is NDJSON (`{"frame": "<base64>", "id": ...}` per line) or
+   * multipart/form-data with one image file per part. Results are streamed
+   * back as NDJSON in completion order, one line per frame, tagged with the
+   * frame's index in the upload (and its id or file name).
+   * `?timings=1`, `?top_k=n`, `?probabilities=1` and `?model=name` apply to
+   * every frame; NDJSON lines may also set `timings`, `top_k`, `probabilities`
+   * and `model` themselves.
+   */
+  handleFrameStream: async (req, res) => {
+    res.status(200);
+    res.set('Content-Type', 'application/x-ndjson');
     
-    // Handle errors
-    pythonProcess.stderr.on('data', (data) => {
-      console.error(`Python Error: ${data}`);
-    });
+    const flag = (value) => value === '1' || value === 'true';
+    const defaults = {
+      timings: flag(req.query.timings),
+      topK: req.query.top_k,
+      probabilities: flag(req.query.probabilities),
+      model: req.query.model
+    };
+    const inFlight = new Set();
     
-    // Process completed
-    pythonProcess.on('close', (code) => {
-      if (code !== 0) {
-        reject(new Error(`Python process exited with code ${code}`));
+    // One wait for the client to catch up, shared by every writer; a client that goes away
+    // instead never drains, so its 'close' ends the wait too
+    let drained = null;
+    const waitForDrain = () => {
+      if (!drained) {
+        drained = new Promise((resolve) => {
+          const done = () => {
+            res.off('drain', done);
+            res.off('close', done);
+            res.off('error', done);
+            drained = null;
+            resolve();
+          };
+          res.on('drain', done);
+          res.on('close', done);
+          res.on('error', done);
+        });
+      }
+      return drained;
+    };
+    const write = async (line) => {
+      if (res.destroyed) {
         return;
       }
+      if (!res.write(JSON.stringify(line) + '\n')) {
+        await waitForDrain();
+      }
+    };
+    
+    const processItem = async (item) => {
+      const tag = { index: item.index };
+      if (item.id !== undefined) {
+        tag.id = item.id;
+      }
+      if (item.name !== undefined) {
+        tag.name = item.name;
+      }
       
+      if (item.error || !item.frame) {
+        return write({ ...tag, status: 'error', message: item.error || 'No frame data provided' });
+      }
       try {
-        // Parse the JSON output from the Python script
-        const inferenceResult = JSON.parse(result);
-        resolve(inferenceResult);
+        const result = await frameController.processFrame(item.frame, {
+          timings: item.timings !== undefined ? item.timings : defaults.timings,
+          topK: item.top_k !== undefined ? item.top_k : defaults.topK,
+          probabilities: item.probabilities !== undefined ? item.probabilities : defaults.probabilities,
+          model: item.model !== undefined ? item.model : defaults.model
+        });
+        await write({ ...tag, status: 'success', message: detectionMessage(result), data: result });
       } catch (error) {
-        reject(new Error(`Failed to parse inference result: ${error.message}`));
+        await write({ ...tag, status: 'error', message: error.message });
       }
-    });
-  });
+    };
+    
+    try {
+      for await (const item of uploadItems(req)) {
+        if (res.destroyed) {
+          break;
+        }
+        const task = processItem(item).finally(() => inFlight.delete(task));
+        inFlight.add(task);
+        if (inFlight.size >= STREAM_MAX_IN_FLIGHT) {
+          await Promise.race(inFlight);
+        }
+      }
+      await Promise.all(inFlight);
+    } catch (error) {
+      await Promise.all(inFlight);
+      if (res.destroyed) {
+        return;
+      }
+      console.error('Error reading frame stream:', error);
+      await write({ status: 'error', message: error.message });
+    }
+    if (!res.destroyed) {
+      res.end();
+    }
+  },
+  
+  /**
+   * Prometheus metrics endpoint: stage histograms plus worker queue depth,
+   * utilization, cache hit rate and loaded models
+   */
+  handleMetrics: async (req, res) => {
+    try {
+      res.set('Content-Type', 'text/plain; version=0.0.4');
+      return res.send(await renderMetrics());
+    } catch (error) {
+      console.error('Error collecting metrics:', error);
+      return res.status(500).json({ status: 'error', message: error.message });
+    }
+  }
+};
+
+/**
+ * Run inference on a frame using the least-loaded Python worker
+ * @param {Buffer} frame - Encoded image bytes
+ * @param {Object} [options] - topK, probabilities, stream and model, see InferenceWorker#infer
+ * @returns {Promise<Object>} - Parsed inference results
+ */
+function runInference(frame, options) {
+  return workerPool.infer(frame, options);
+}
+
+/**
+ * A more user-friendly summary of an inference result
+ * @param {Object} result - Inference result
+ * @returns {String}
+ */
+function detectionMessage(result) {
+  let detectedObject = result.prediction || "unknown object";
+  let confidence = result.confidence ? (result.confidence * 100).toFixed(2) + "%" : "unknown";
+  return `Detected: ${detectedObject} (Confidence: ${confidence})`;
+}
+
+/**
+ * Render the server's histograms and a snapshot of every worker's statistics
+ * @returns {Promise<String>} - Prometheus text exposition format
+ */
+async function renderMetrics() {
+  const workers = await workerPool.stats();
+  const perWorker = (value) => workers.map((worker) => ({
+    labels: { worker: String(worker.index) },
+    value: value(worker)
+  }));
+  const batching = (worker) => worker.batching || {};
+  const cache = (worker) => worker.cache || {};
+  const gating = (worker) => worker.gating || {};
+  const models = (worker) => worker.models || {};
+  const perModel = workers.flatMap((worker) => (models(worker).loaded || []).map((model) => ({
+    labels: { worker: String(worker.index), model: model.model },
+    value: model.bytes
+  })));
+  const seconds = (ms) => (ms === null || ms === undefined ? null : ms / 1000);
+  
+  return [
+    stageDurations.render(),
+    framesTotal.render(),
+    modelFrames.render(),
+    sample('inference_worker_up', 'Whether the worker is running', 'gauge',
+      perWorker((worker) => (worker.running ? 1 : 0))),
+    sample('inference_worker_in_flight', 'Requests sent to the worker and not answered yet', 'gauge',
+      perWorker((worker) => worker.inFlight)),
+    sample('inference_worker_queue_depth', 'Frames waiting in the worker for a batch slot', 'gauge',
+      perWorker((worker) => batching(worker).queue_depth)),
+    sample('inference_worker_utilization', 'Share of the worker lifetime spent running batches', 'gauge',
+      perWorker((worker) => batching(worker).utilization)),
+    sample('inference_worker_busy_seconds_total', 'Time the worker spent running batches', 'counter',
+      perWorker((worker) => seconds(batching(worker).busy_ms_total))),
+    sample('inference_worker_batches_total', 'Forward passes run by the worker', 'counter',
+      perWorker((worker) => batching(worker).batches)),
+    sample('inference_worker_mean_batch_size', 'Mean frames per forward pass', 'gauge',
+      perWorker((worker) => batching(worker).mean_batch_size)),
+    sample('inference_worker_restarts_total', 'Times the worker was restarted', 'counter',
+      perWorker((worker) => worker.restarts)),
+    sample('inference_worker_start_seconds', 'Spawn to ready time of the current process', 'gauge',
+      perWorker((worker) => seconds(worker.startMs))),
+    sample('inference_worker_model_load_seconds', 'Model load and warmup time of the current process', 'gauge',
+      perWorker((worker) => seconds(worker.loadMs))),
+    sample('inference_cache_hits_total', 'Result cache hits', 'counter',
+      perWorker((worker) => cache(worker).hits)),
+    sample('inference_cache_misses_total', 'Result cache misses', 'counter',
+      perWorker((worker) => cache(worker).misses)),
+    sample('inference_cache_hit_rate', 'Result cache hits per lookup', 'gauge',
+      perWorker((worker) => cache(worker).hit_rate)),
+    sample('inference_cache_entries', 'Frames in the result cache', 'gauge',
+      perWorker((worker) => cache(worker).size)),
+    sample('inference_scene_reused_total', 'Stream frames answered with the last result of a static scene', 'counter',
+      perWorker((worker) => gating(worker).reused)),
+    sample('inference_scene_reuse_rate', 'Share of checked stream frames whose last result was reused', 'gauge',
+      perWorker((worker) => gating(worker).reuse_rate)),
+    sample('inference_scene_streams', 'Streams with scene-change state on the worker', 'gauge',
+      perWorker((worker) => gating(worker).streams)),
+    sample('inference_model_memory_bytes', 'Approximate weight memory of each model loaded on the worker', 'gauge',
+      perModel),
+    sample('inference_worker_model_memory_bytes', 'Approximate weight memory of all models loaded on the worker', 'gauge',
+      perWorker((worker) => models(worker).bytes)),
+    sample('inference_worker_models_loaded', 'Models loaded on the worker', 'gauge',
+      perWorker((worker) => (models(worker).loaded ? models(worker).loaded.length : null))),
+    sample('inference_model_loads_total', 'Models loaded by the worker, including reloads after eviction', 'counter',
+      perWorker((worker) => models(worker).loads)),
+    sample('inference_model_evictions_total', 'Models evicted by the worker to stay within its memory budget', 'counter',
+      perWorker((worker) => models(worker).evictions)),
+    sample('inference_model_load_failures_total', 'Failed model loads on the worker', 'counter',
+      perWorker((worker) => models(worker).load_failures))
+  ].join('\n') + '\n';
 }
 
 module.exports = frameController;
\ No newline at end of file
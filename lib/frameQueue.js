@@ -0,0 +1,96 @@
+/**
+ * Per-connection frame admission with latest-frame-wins backpressure.
+ *
+ * At most `maxInFlight` frames from one connection are processed at a time.
+ * Frames that arrive while those slots are busy wait in a queue of at most
+ * `maxQueued`; when it is full, the oldest queued frame is dropped in favour
+ * of the newest one, so a fast client only ever waits for recent frames and
+ * memory stays bounded no matter how far ahead of the model it runs.
+ */
+class FrameQueue {
+  /**
+   * @param {Function} handler - async (frame) => void, processes one frame
+   * @param {Object} [options]
+   * @param {Number} [options.maxInFlight] - Frames processed concurrently (default: 1)
+   * @param {Number} [options.maxQueued] - Frames waiting for a slot (default: 1)
+   */
+  constructor(handler, options = {}) {
+    this.handler = handler;
+    this.maxInFlight = Math.max(1, options.maxInFlight || 1);
+    this.maxQueued = Math.max(0, options.maxQueued !== undefined ? options.maxQueued : 1);
+    this.queue = [];
+    this.inFlight = 0;
+    this.received = 0;
+    this.processed = 0;
+    this.dropped = 0;
+    this.closed = false;
+  }
+
+  /**
+   * Submit a frame; it runs now, waits for a slot, or replaces an older queued frame
+   * @param {*} frame - Passed to the handler unchanged
+   * @returns {Boolean} - False if the frame was dropped immediately
+   */
+  push(frame) {
+    if (this.closed) {
+      return false;
+    }
+    this.received++;
+
+    if (this.inFlight < this.maxInFlight) {
+      this._run(frame);
+      return true;
+    }
+
+    if (this.maxQueued === 0) {
+      this.dropped++;
+      return false;
+    }
+
+    this.queue.push(frame);
+    if (this.queue.length > this.maxQueued) {
+      this.queue.shift();
+      this.dropped++;
+    }
+    return true;
+  }
+
+  /**
+   * Counters reported back to the client
+   */
+  stats() {
+    return {
+      received: this.received,
+      processed: this.processed,
+      dropped: this.dropped,
+      queued: this.queue.length,
+      inFlight: this.inFlight
+    };
+  }
+
+  /**
+   * Discard queued frames; frames already in flight still finish
+   */
+  close() {
+    this.closed = true;
+    this.dropped += this.queue.length;
+    this.queue = [];
+  }
+
+  async _run(frame) {
+    this.inFlight++;
+    try {
+      await this.handler(frame);
+    } catch (error) {
+      console.error('Error in frame handler:', error);
+    } finally {
+      this.inFlight--;
+      this.processed++;
+      if (this.queue.length && !this.closed) {
+        this._run(this.queue.shift());
+      }
+    }
+  }
+}
+
+module.exports = FrameQueue;
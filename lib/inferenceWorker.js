@@ -0,0 +1,360 @@
+const { spawn } = require('child_process');
+const EventEmitter = require('events');
+const path = require('path');
+const readline = require('readline');
+const { elapsedMs } = require('./metrics');
+
+const INFER_SCRIPT = path.join(__dirname, '../model/infer.py');
+
+/**
+ * Long-lived `infer.py --serve` process.
+ *
+ * The model is loaded once when the process starts; every request after that
+ * only pays for the forward pass. Requests are newline-delimited JSON tagged
+ * with an id, each optionally followed by the raw frame bytes, so frames never
+ * go through the filesystem and several can be in flight on the same pipe; the worker
+ * batches frames that arrive together into a single forward pass.
+ */
+class InferenceWorker extends EventEmitter {
+  /**
+   * @param {Object} [options]
+   * @param {Number} [options.maxBatchSize] - Largest batch per forward pass
+   * @param {Number} [options.maxWaitMs] - Longest time a frame waits for its batch to fill
+   * @param {Number} [options.threads] - Intra-op threads for the framework
+   * @param {Number[]} [options.cpus] - CPU ids to pin the worker to
+   * @param {Number} [options.cacheSize] - Distinct frames whose results are cached (0 disables)
+   * @param {Number} [options.cacheTtl] - Seconds a cached result stays valid
+   * @param {String} [options.cacheMode] - 'exact' or 'perceptual'
+   * @param {String} [options.backend] - 'eager', 'torchscript', 'onnxruntime' or 'tflite'
+   * @param {String} [options.quantize] - 'dynamic' or 'static' int8 quantization
+   * @param {String} [options.weights] - Local weight file for the default model
+   * @param {String} [options.model] - Default model, by registry name
+   * @param {String} [options.models] - JSON file of extra named models requests can select
+   * @param {Number} [options.memoryBudgetMb] - Memory the loaded models may take before idle ones are evicted
+   * @param {Number} [options.topK] - Most classes a request can ask for (--top-k)
+   * @param {Number} [options.sceneThreshold] - Share of changed blocks a stream may reuse its result under
+   * @param {Number} [options.maxStalenessMs] - Longest a stream may reuse one result
+   * @param {Boolean} [options.warmup] - Run a dummy batch before reporting ready
+   */
+  constructor(options = {}) {
+    super();
+    this.options = options;
+    this.process = null;
+    this.ready = null;
+    this.alive = false;
+    this.pending = new Map();
+    this.starting = 0;
+    this.nextId = 1;
+    this.startInfo = null;
+    // Models this process has served, for routing; one evicted since is simply loaded again
+    this.models = new Set();
+  }
+
+  /**
+   * Spawn the Python process if it is not running yet
+   * @returns {Promise<Object>} - Resolves with the worker's ready message
+   */
+  start() {
+    if (this.ready) {
+      return this.ready;
+    }
+
+    this.ready = new Promise((resolve, reject) => {
+      const spawnedAt = process.hrtime.bigint();
+      const pythonProcess = spawn('python', [INFER_SCRIPT, '--serve', ...this._args()], {
+        env: this._env()
+      });
+      this.process = pythonProcess;
+
+      const lines = readline.createInterface({ input: pythonProcess.stdout });
+      let started = false;
+
+      lines.on('line', (line) => {
+        const received = process.hrtime.bigint();
+        let message;
+        try {
+          message = JSON.parse(line);
+        } catch (error) {
+          console.error(`Failed to parse inference worker output: ${line}`);
+          return;
+        }
+        if (message.timings) {
+          message.timings.parse_ms = elapsedMs(received);
+        }
+
+        if (!started) {
+          started = true;
+          if (message.ready) {
+            this.alive = true;
+            // Spawn to ready, and the model load (plus warmup) the worker reports within it
+            this.startInfo = { startMs: elapsedMs(spawnedAt), loadMs: message.load_ms };
+            this.models = new Set([message.model]);
+            resolve(message);
+          } else {
+            reject(new Error(message.error || 'Inference worker failed to start'));
+          }
+          return;
+        }
+
+        this._settle(message);
+      });
+
+      // Writes racing a crash fail with EPIPE; the close handler rejects those requests
+      pythonProcess.stdin.on('error', (error) => {
+        console.error(`Inference worker stdin error: ${error.message}`);
+      });
+
+      pythonProcess.stderr.on('data', (data) => {
+        console.error(`Python Error: ${data}`);
+      });
+
+      pythonProcess.on('error', (error) => {
+        if (!started) {
+          started = true;
+          reject(error);
+        }
+      });
+
+      pythonProcess.on('close', (code) => {
+        if (!started) {
+          started = true;
+          reject(new Error(`Python process exited with code ${code}`));
+        }
+        if (this.process === pythonProcess) {
+          this._reset(new Error(`Inference worker exited with code ${code}`));
+          this.emit('exit', code);
+        }
+      });
+    });
+
+    // A failed start is retried on the next request
+    const ready = this.ready;
+    ready.catch(() => {
+      if (this.ready === ready) {
+        this.stop();
+        this._reset();
+      }
+    });
+
+    return this.ready;
+  }
+
+  /**
+   * Number of requests sent to the worker that have not been answered yet
+   */
+  get load() {
+    return this.pending.size + this.starting;
+  }
+
+  /**
+   * Send a request to the worker and wait for its response
+   * @param {Object} request - Request body, e.g. { op: 'ping' }
+   * @param {Buffer} [payload] - Raw bytes sent on the pipe right after the header line
+   * @returns {Promise<Object>} - Response message with the id removed
+   */
+  async request(request, payload) {
+    // Count the request as in flight while it waits for the process to be ready
+    this.starting++;
+    try {
+      await this.start();
+    } finally {
+      this.starting--;
+    }
+
+    return new Promise((resolve, reject) => {
+      if (!this.process) {
+        reject(new Error('Inference worker is not running'));
+        return;
+      }
+
+      const id = this.nextId++;
+      const header = payload ? { ...request, id, size: payload.length } : { ...request, id };
+      this.pending.set(id, { resolve, reject });
+      this.process.stdin.write(JSON.stringify(header) + '\n');
+      if (payload) {
+        this.process.stdin.write(payload);
+      }
+    });
+  }
+
+  /**
+   * Run inference on a frame
+   * @param {Buffer|String} frame - Encoded image bytes, or a path to an image file
+   * @param {Object} [options]
+   * @param {Number} [options.topK] - Classes to list in `top_k` (capped by the worker's topK)
+   * @param {Boolean} [options.probabilities] - Add the full distribution as base64 packed float32
+   * @param {String} [options.stream] - Stream id; the worker reuses the stream's last
+   *   result while the scene has not changed, and sets `reused: true` on it
+   * @param {String} [options.model] - Registry model to run (default: the worker's default model)
+   * @returns {Promise<Object>} - Same result object as the one-shot CLI with --timings:
+   *   the worker's stage times in ms, plus `worker_ms` (request written to response
+   *   parsed) and `parse_ms` (JSON.parse of the response line)
+   */
+  async infer(frame, options = {}) {
+    const sent = process.hrtime.bigint();
+    const request = {
+      timings: true,
+      top_k: options.topK,
+      probabilities: options.probabilities,
+      stream: options.stream,
+      model: options.model
+    };
+    const response = Buffer.isBuffer(frame)
+      ? await this.request(request, frame)
+      : await this.request({ ...request, path: frame });
+    if (response.error) {
+      throw new Error(response.error);
+    }
+    if (response.result.model) {
+      this.models.add(response.result.model);
+    }
+    const result = { ...response.result, timings: { ...response.timings, worker_ms: elapsedMs(sent) } };
+    if (response.reused) {
+      result.reused = true;
+      result.scene_delta = response.scene_delta;
+    }
+    return result;
+  }
+
+  /**
+   * Drop the worker's scene-change state for a stream
+   * @param {String} stream - Stream id passed to infer()
+   */
+  async release(stream) {
+    await this.request({ op: 'release', stream });
+  }
+
+  /**
+   * Fetch the worker's batching and cache statistics
+   * @returns {Promise<Object>} - Achieved batch sizes, queue wait times and cache counters
+   */
+  async stats() {
+    const response = await this.request({ op: 'stats' });
+    return response.stats;
+  }
+
+  /**
+   * Check that the worker answers within the given time
+   * @param {Number} timeoutMs - How long to wait for the pong
+   * @returns {Promise<Boolean>} - Whether the worker responded in time
+   */
+  async ping(timeoutMs) {
+    let timer;
+    const timeout = new Promise((resolve) => {
+      timer = setTimeout(() => resolve(false), timeoutMs);
+    });
+
+    try {
+      return await Promise.race([
+        this.request({ op: 'ping' }).then((response) => response.pong === true),
+        timeout
+      ]);
+    } catch (error) {
+      return false;
+    } finally {
+      clearTimeout(timer);
+    }
+  }
+
+  /**
+   * Terminate the Python process
+   * @param {String} [signal] - Signal to send (default: SIGTERM)
+   */
+  stop(signal) {
+    if (this.process) {
+      this.process.kill(signal);
+    }
+  }
+
+  _args() {
+    const args = [];
+    if (this.options.maxBatchSize) {
+      args.push('--max-batch-size', String(this.options.maxBatchSize));
+    }
+    if (this.options.maxWaitMs !== undefined) {
+      args.push('--max-wait-ms', String(this.options.maxWaitMs));
+    }
+    if (this.options.threads) {
+      args.push('--threads', String(this.options.threads));
+    }
+    if (this.options.cpus && this.options.cpus.length) {
+      args.push('--cpus', this.options.cpus.join(','));
+    }
+    if (this.options.cacheSize) {
+      args.push('--cache-size', String(this.options.cacheSize));
+    }
+    if (this.options.cacheTtl) {
+      args.push('--cache-ttl', String(this.options.cacheTtl));
+    }
+    if (this.options.cacheMode) {
+      args.push('--cache-mode', this.options.cacheMode);
+    }
+    if (this.options.backend) {
+      args.push('--backend', this.options.backend);
+    }
+    if (this.options.quantize) {
+      args.push('--quantize', this.options.quantize);
+    }
+    if (this.options.weights) {
+      args.push('--weights', this.options.weights);
+    }
+    if (this.options.model) {
+      args.push('--model', this.options.model);
+    }
+    if (this.options.models) {
+      args.push('--models', this.options.models);
+    }
+    if (this.options.memoryBudgetMb) {
+      args.push('--memory-budget-mb', String(this.options.memoryBudgetMb));
+    }
+    if (this.options.warmup) {
+      args.push('--warmup');
+    }
+    if (this.options.topK) {
+      args.push('--top-k', String(this.options.topK));
+    }
+    if (this.options.sceneThreshold !== undefined) {
+      args.push('--scene-threshold', String(this.options.sceneThreshold));
+    }
+    if (this.options.maxStalenessMs !== undefined) {
+      args.push('--max-staleness', String(this.options.maxStalenessMs / 1000));
+    }
+    return args;
+  }
+
+  _env() {
+    if (!this.options.threads) {
+      return process.env;
+    }
+
+    // Keep the BLAS/OpenMP pools that the frameworks build on to the same size
+    const threads = String(this.options.threads);
+    return { ...process.env, OMP_NUM_THREADS: threads, MKL_NUM_THREADS: threads };
+  }
+
+  _settle(message) {
+    const { id, ...response } = message;
+    const entry = this.pending.get(id);
+    if (!entry) {
+      console.error(`Unexpected inference worker response: ${JSON.stringify(message)}`);
+      return;
+    }
+    this.pending.delete(id);
+    entry.resolve(response);
+  }
+
+  _reset(error) {
+    if (error) {
+      for (const { reject } of this.pending.values()) {
+        reject(error);
+      }
+    }
+    this.pending.clear();
+    this.process = null;
+    this.ready = null;
+    this.alive = false;
+    this.models.clear();
+  }
+}
+
+module.exports = InferenceWorker;
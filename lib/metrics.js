@@ -0,0 +1,125 @@
+/**
+ * Minimal Prometheus text-format metrics.
+ *
+ * Histograms are aggregated in-process; gauges and counters that live in the
+ * Python workers are rendered from a snapshot at scrape time with `sample()`.
+ * See https://prometheus.io/docs/instrumenting/exposition_formats/
+ */
+
+// Seconds; spans sub-millisecond stages up to a cold model load
+const DEFAULT_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10];
+
+class Histogram {
+  /**
+   * @param {String} name - Metric name, e.g. 'inference_stage_duration_seconds'
+   * @param {String} help - One-line description
+   * @param {Object} [options]
+   * @param {String} [options.labelName] - Label that splits the series (e.g. 'stage')
+   * @param {Number[]} [options.buckets] - Upper bounds, ascending
+   */
+  constructor(name, help, options = {}) {
+    this.name = name;
+    this.help = help;
+    this.labelName = options.labelName;
+    this.buckets = options.buckets || DEFAULT_BUCKETS;
+    this.series = new Map();
+  }
+
+  /**
+   * Record one observation
+   * @param {String} label - Value of the histogram's label ('' when it has none)
+   * @param {Number} value - Observed value, in the metric's unit
+   */
+  observe(label, value) {
+    let series = this.series.get(label);
+    if (!series) {
+      series = { counts: new Array(this.buckets.length).fill(0), sum: 0, count: 0 };
+      this.series.set(label, series);
+    }
+    const index = this.buckets.findIndex((bound) => value <= bound);
+    if (index !== -1) {
+      series.counts[index]++;
+    }
+    series.sum += value;
+    series.count++;
+  }
+
+  render() {
+    const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} histogram`];
+    for (const [label, series] of this.series) {
+      const base = this.labelName ? { [this.labelName]: label } : {};
+      let cumulative = 0;
+      this.buckets.forEach((bound, i) => {
+        cumulative += series.counts[i];
+        lines.push(line(`${this.name}_bucket`, { ...base, le: String(bound) }, cumulative));
+      });
+      lines.push(line(`${this.name}_bucket`, { ...base, le: '+Inf' }, series.count));
+      lines.push(line(`${this.name}_sum`, base, series.sum));
+      lines.push(line(`${this.name}_count`, base, series.count));
+    }
+    return lines.join('\n');
+  }
+}
+
+class Counter {
+  /**
+   * @param {String} name - Metric name, ending in _total
+   * @param {String} help - One-line description
+   * @param {String} [labelName] - Label that splits the series
+   */
+  constructor(name, help, labelName) {
+    this.name = name;
+    this.help = help;
+    this.labelName = labelName;
+    this.values = new Map();
+  }
+
+  inc(label = '', amount = 1) {
+    this.values.set(label, (this.values.get(label) || 0) + amount);
+  }
+
+  render() {
+    return sample(this.name, this.help, 'counter', [...this.values].map(([label, value]) => ({
+      labels: this.labelName ? { [this.labelName]: label } : {},
+      value
+    })));
+  }
+}
+
+/**
+ * Render a metric from a snapshot of values
+ * @param {String} name - Metric name
+ * @param {String} help - One-line description
+ * @param {String} type - 'gauge' or 'counter'
+ * @param {Object[]} samples - [{ labels: { worker: '0' }, value: 3 }, ...]
+ * @returns {String}
+ */
+function sample(name, help, type, samples) {
+  const lines = [`# HELP ${name} ${help}`, `# TYPE ${name} ${type}`];
+  for (const { labels, value } of samples) {
+    if (value !== undefined && value !== null) {
+      lines.push(line(name, labels || {}, value));
+    }
+  }
+  return lines.join('\n');
+}
+
+function line(name, labels, value) {
+  const pairs = Object.entries(labels).map(([key, label]) => `${key}="${escape(label)}"`);
+  return `${name}${pairs.length ? `{${pairs.join(',')}}` : ''} ${Number(value)}`;
+}
+
+function escape(value) {
+  return String(value).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"');
+}
+
+/**
+ * Milliseconds since a process.hrtime.bigint() reading
+ * @param {BigInt} start
+ * @returns {Number}
+ */
+function elapsedMs(start) {
+  return Number(process.hrtime.bigint() - start) / 1e6;
+}
+
+module.exports = { Histogram, Counter, sample, elapsedMs };
@@ -0,0 +1,49 @@
+/**
+ * Compact binary encoding of a response carrying the full class distribution.
+ *
+ * JSON-encoding 1000 probabilities per frame costs more than the rest of the
+ * response together, so high-rate clients can ask for a binary WebSocket
+ * message instead:
+ *
+ *   bytes 0-3    uint32 LE, length H of the JSON header
+ *   bytes 4..    the response as UTF-8 JSON without `data.probabilities`,
+ *                space-padded so 4 + H is a multiple of 4
+ *   bytes 4+H..  the probabilities as little-endian float32, in class order
+ *
+ * so a browser reads them with `new Float32Array(buffer, 4 + H)` and no copy.
+ */
+
+/**
+ * @param {Object} message - Response whose `data.probabilities` is base64 packed float32
+ * @returns {Buffer}
+ */
+function encodeBinaryResult(message) {
+  const { probabilities, ...data } = message.data;
+  const packed = Buffer.from(probabilities || '', 'base64');
+
+  let header = Buffer.from(JSON.stringify({ ...message, data, classes: packed.length / 4 }), 'utf8');
+  const padding = (4 - ((4 + header.length) % 4)) % 4;
+  if (padding) {
+    header = Buffer.concat([header, Buffer.alloc(padding, 0x20)]);
+  }
+
+  const prefix = Buffer.alloc(4);
+  prefix.writeUInt32LE(header.length, 0);
+  return Buffer.concat([prefix, header, packed]);
+}
+
+/**
+ * Inverse of encodeBinaryResult, for Node clients and tests
+ * @param {Buffer} buffer
+ * @returns {Object} - The response, with `data.probabilities` as a Float32Array
+ */
+function decodeBinaryResult(buffer) {
+  const length = buffer.readUInt32LE(0);
+  const message = JSON.parse(buffer.toString('utf8', 4, 4 + length));
+  // Copy into an aligned buffer; a Node Buffer may start at any offset of its pool
+  const packed = buffer.subarray(4 + length);
+  message.data.probabilities = new Float32Array(new Uint8Array(packed).buffer);
+  return message;
+}
+
+module.exports = { encodeBinaryResult, decodeBinaryResult };
@@ -0,0 +1,206 @@
+/**
+ * Incremental parsing of streamed frame uploads.
+ *
+ * `uploadItems(req)` turns a request body into an async iterator of frames as
+ * the bytes arrive, so a long upload is processed while it is still being
+ * sent and only the current part is ever held in memory. A line or part may
+ * take up to 50 MB, like a WebSocket message. Two body formats are understood:
+ *
+ *   application/x-ndjson   one `{"frame": "<base64>", "id": ...}` object per line,
+ *                          optionally with its own `timings`, `top_k`, `probabilities` and `model`
+ *   multipart/form-data    every file part is a frame (raw image bytes); a
+ *                          text field named `frame` holds a base64 frame
+ */
+
+const { StringDecoder } = require('string_decoder');
+
+// Guards against a body that never delimits its lines, parts or part headers
+const MAX_LINE_BYTES = 50 * 1024 * 1024;
+const MAX_PART_BYTES = 50 * 1024 * 1024;
+const MAX_HEADER_BYTES = 16 * 1024;
+
+/**
+ * @param {http.IncomingMessage} req - Request whose body has not been consumed yet
+ * @returns {AsyncGenerator<Object>} - { index, frame, id?, name?, timings?, top_k?, probabilities?, model? } per frame;
+ *   frame is a Buffer of image bytes or a base64 string
+ */
+async function* uploadItems(req) {
+  const contentType = req.headers['content-type'] || '';
+  const boundary = /boundary=(?:"([^"]+)"|([^;]+))/i.exec(contentType);
+
+  let index = 0;
+  if (/^multipart\/form-data/i.test(contentType)) {
+    if (!boundary) {
+      throw new Error('Multipart upload without a boundary');
+    }
+    for await (const part of multipartParts(req, boundary[1] || boundary[2])) {
+      if (part.filename !== undefined) {
+        yield { index: index++, frame: part.data, name: part.filename };
+      } else if (part.name === 'frame') {
+        yield { index: index++, frame: part.data.toString('utf8') };
+      }
+    }
+    return;
+  }
+
+  for await (const line of ndjsonLines(req)) {
+    let message;
+    try {
+      message = JSON.parse(line);
+    } catch (error) {
+      yield { index: index++, error: `Invalid JSON line: ${error.message}` };
+      continue;
+    }
+    yield {
+      index: index++,
+      frame: message.frame,
+      id: message.id,
+      timings: message.timings,
+      top_k: message.top_k,
+      probabilities: message.probabilities,
+      model: message.model
+    };
+  }
+}
+
+async function* ndjsonLines(stream) {
+  // Characters split across chunks are held back by the decoder instead of being mangled
+  const decoder = new StringDecoder('utf8');
+  // The line being received, as the pieces of each chunk; joined once when its newline arrives,
+  // so every byte is scanned and copied a bounded number of times however long the line is
+  let pieces = [];
+  let length = 0;
+  const takeLine = () => {
+    const line = pieces.join('').trim();
+    pieces = [];
+    length = 0;
+    return line;
+  };
+
+  for await (const chunk of stream) {
+    const text = decoder.write(chunk);
+    let start = 0;
+    let newline;
+    while ((newline = text.indexOf('\n', start)) !== -1) {
+      pieces.push(text.slice(start, newline));
+      start = newline + 1;
+      const line = takeLine();
+      if (line) {
+        yield line;
+      }
+    }
+    if (start < text.length) {
+      pieces.push(text.slice(start));
+      length += text.length - start;
+    }
+    if (length > MAX_LINE_BYTES) {
+      throw new Error('NDJSON line too long');
+    }
+  }
+  pieces.push(decoder.end());
+  const line = takeLine();
+  if (line) {
+    yield line;
+  }
+}
+
+/**
+ * Yield { name, filename, contentType, data } for each part of a multipart body
+ */
+async function* multipartParts(stream, boundary) {
+  // Every boundary after the first is preceded by CRLF; starting with one lets a single search handle both
+  const delimiter = Buffer.from(`\r\n--${boundary}`);
+  let state = 'preamble';
+  let headers = null;
+  // Body bytes of the current part that can no longer hold the start of a delimiter,
+  // joined once when the part ends instead of re-copied with every chunk
+  let body = [];
+  let bodyLength = 0;
+  let buffer = Buffer.from('\r\n');
+
+  for await (const chunk of stream) {
+    buffer = buffer.length ? Buffer.concat([buffer, chunk]) : chunk;
+
+    for (;;) {
+      if (state === 'preamble' || state === 'body') {
+        const at = buffer.indexOf(delimiter);
+        if (at === -1) {
+          // Keep only a tail that may hold the beginning of a delimiter split across chunks
+          const keep = Math.min(buffer.length, delimiter.length - 1);
+          if (state === 'body' && buffer.length > keep) {
+            body.push(buffer.subarray(0, buffer.length - keep));
+            bodyLength += buffer.length - keep;
+            if (bodyLength > MAX_PART_BYTES) {
+              throw new Error('Multipart part too large');
+            }
+          }
+          buffer = buffer.subarray(buffer.length - keep);
+          break;
+        }
+        if (state === 'body') {
+          body.push(buffer.subarray(0, at));
+          if (bodyLength + at > MAX_PART_BYTES) {
+            throw new Error('Multipart part too large');
+          }
+          yield { ...headers, data: Buffer.concat(body) };
+          body = [];
+          bodyLength = 0;
+        }
+        buffer = buffer.subarray(at + delimiter.length);
+        state = 'boundary';
+      } else if (state === 'boundary') {
+        if (buffer.length < 2) {
+          break;
+        }
+        if (buffer[0] === 0x2d && buffer[1] === 0x2d) {
+          return;
+        }
+        const lineEnd = buffer.indexOf('\r\n');
+        if (lineEnd === -1) {
+          break;
+        }
+        buffer = buffer.subarray(lineEnd + 2);
+        state = 'headers';
+      } else {
+        const end = buffer.indexOf('\r\n\r\n');
+        if (end === -1) {
+          if (buffer.length > MAX_HEADER_BYTES) {
+            throw new Error('Multipart part headers too long');
+          }
+          break;
+        }
+        headers = parsePartHeaders(buffer.subarray(0, end).toString('utf8'));
+        buffer = buffer.subarray(end + 4);
+        state = 'body';
+      }
+    }
+  }
+
+  if (state !== 'preamble') {
+    throw new Error('Multipart upload ended before its closing boundary');
+  }
+}
+
+function parsePartHeaders(text) {
+  const part = {};
+  for (const line of text.split('\r\n')) {
+    const colon = line.indexOf(':');
+    const key = line.slice(0, colon).trim().toLowerCase();
+    const value = line.slice(colon + 1).trim();
+    if (key === 'content-disposition') {
+      const name = /\bname="([^"]*)"/i.exec(value);
+      const filename = /\bfilename="([^"]*)"/i.exec(value);
+      if (name) {
+        part.name = name[1];
+      }
+      if (filename) {
+        part.filename = filename[1];
+      }
+    } else if (key === 'content-type') {
+      part.contentType = value;
+    }
+  }
+  return part;
+}
+
+module.exports = { uploadItems };
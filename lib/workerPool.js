@@ -0,0 +1,247 @@
+const os = require('os');
+const InferenceWorker = require('./inferenceWorker');
+
+/**
+ * Fixed-size pool of long-lived inference workers.
+ *
+ * Each worker gets its own slice of the machine's CPUs and a matching
+ * intra-op thread count, so N workers scale with cores instead of fighting
+ * over them. Requests go to the worker with the fewest frames in flight,
+ * except that every frame of a stream goes to the worker that holds the
+ * stream's scene-change state, for as long as that worker is up. A request
+ * for a model other than the default goes to the least-loaded worker that
+ * already has it loaded, unless that worker is modelSpillLoad frames busier
+ * than the least-loaded one; then the least-loaded worker loads it too, so a
+ * busy model spreads over the pool while a rarely used one stays in one
+ * worker's memory. Unresponsive workers are killed by a periodic health
+ * check, and workers that exit are restarted with exponential backoff.
+ */
+class WorkerPool {
+  /**
+   * @param {Object} [options]
+   * @param {Number} [options.size] - Number of workers (default: min(4, available CPUs))
+   * @param {Number} [options.threadsPerWorker] - Intra-op threads per worker (default: CPUs / size)
+   * @param {Boolean} [options.pinCpus] - Pin each worker to its own CPUs (default: true on Linux)
+   * @param {Number} [options.healthCheckIntervalMs] - Time between pings (default: 10000)
+   * @param {Number} [options.healthCheckTimeoutMs] - Time a ping may take (default: 5000)
+   * @param {Number} [options.modelSpillLoad] - Extra frames in flight on the workers holding a
+   *   model before another worker loads it (default: maxBatchSize, or 16)
+   *
+   * Any other option (maxBatchSize, maxWaitMs, cacheSize, ...) is passed to
+   * each InferenceWorker unchanged.
+   */
+  constructor(options = {}) {
+    const {
+      size: requestedSize,
+      threadsPerWorker,
+      pinCpus: requestedPinCpus,
+      healthCheckIntervalMs,
+      healthCheckTimeoutMs,
+      modelSpillLoad,
+      ...workerOptions
+    } = options;
+
+    // The CPUs this process may run on (its affinity mask), not every CPU of the host
+    const cpuCount = (os.availableParallelism ? os.availableParallelism() : os.cpus().length) || 1;
+    const size = Math.max(1, requestedSize || Math.min(4, cpuCount));
+    const threads = Math.max(1, threadsPerWorker || Math.floor(cpuCount / size));
+    const pinCpus = requestedPinCpus !== undefined ? requestedPinCpus : process.platform === 'linux';
+
+    this.healthCheckIntervalMs = healthCheckIntervalMs || 10000;
+    this.healthCheckTimeoutMs = healthCheckTimeoutMs || 5000;
+    this.modelSpillLoad = modelSpillLoad || workerOptions.maxBatchSize || 16;
+    this.started = false;
+    this.stopped = false;
+    this.healthTimer = null;
+    this.checkingHealth = false;
+
+    // Stream id -> the worker its frames are routed to
+    this.streams = new Map();
+
+    this.workers = [];
+    for (let i = 0; i < size; i++) {
+      const worker = new InferenceWorker({
+        ...workerOptions,
+        threads,
+        cpus: pinCpus ? cpuSlice(i, threads, cpuCount) : undefined
+      });
+      worker.restarts = 0;
+      worker.backoffMs = 0;
+      worker.on('exit', (code) => this._restart(worker, code));
+      this.workers.push(worker);
+    }
+  }
+
+  /**
+   * Spawn every worker and begin health checks
+   */
+  start() {
+    if (this.started) {
+      return;
+    }
+    this.started = true;
+
+    for (const worker of this.workers) {
+      this._spawn(worker);
+    }
+
+    this.healthTimer = setInterval(() => this._checkHealth(), this.healthCheckIntervalMs);
+    this.healthTimer.unref();
+  }
+
+  /**
+   * Run inference on the least-loaded worker (that has the requested model)
+   * @param {Buffer|String} frame - Encoded image bytes, or a path to an image file
+   * @param {Object} [options] - Passed to InferenceWorker#infer
+   * @returns {Promise<Object>} - Same result object as the one-shot CLI
+   */
+  infer(frame, options = {}) {
+    this.start();
+    return this._workerFor(options.stream, options.model).infer(frame, options);
+  }
+
+  /**
+   * Forget a stream: its routing and the worker's scene-change state for it
+   * @param {String} stream - Stream id passed to infer()
+   */
+  release(stream) {
+    const worker = this.streams.get(stream);
+    this.streams.delete(stream);
+    if (worker && worker.alive) {
+      worker.release(stream).catch(() => {});
+    }
+  }
+
+  /**
+   * Per-worker load, restart count, start time, batching, cache and model statistics
+   * @returns {Promise<Object[]>}
+   */
+  async stats() {
+    return Promise.all(this.workers.map(async (worker, index) => ({
+      index,
+      running: worker.alive,
+      inFlight: worker.load,
+      restarts: worker.restarts,
+      startMs: worker.startInfo ? worker.startInfo.startMs : null,
+      loadMs: worker.startInfo ? worker.startInfo.loadMs : null,
+      cpus: worker.options.cpus || null,
+      threads: worker.options.threads,
+      ...(worker.alive ? await worker.stats().catch(() => ({})) : {})
+    })));
+  }
+
+  stop() {
+    this.stopped = true;
+    clearInterval(this.healthTimer);
+    for (const worker of this.workers) {
+      worker.stop();
+    }
+  }
+
+  _workerFor(stream, model) {
+    if (stream === undefined) {
+      return this._forModel(model);
+    }
+
+    // A stream moves only when its worker is down; the new worker starts with no state for it
+    let worker = this.streams.get(stream);
+    if (!worker || !worker.alive) {
+      worker = this._forModel(model);
+      this.streams.set(stream, worker);
+    }
+    return worker;
+  }
+
+  _forModel(model) {
+    const least = this._leastLoaded(this.workers);
+    if (!model) {
+      return least;
+    }
+    const holders = this.workers.filter((worker) => worker.alive && worker.models.has(model));
+    if (!holders.length) {
+      return least;
+    }
+    const best = this._leastLoaded(holders);
+    return best.load - least.load >= this.modelSpillLoad ? least : best;
+  }
+
+  _leastLoaded(workers) {
+    // Prefer ready workers so a request does not wait behind a restart
+    let best = null;
+    for (const worker of workers) {
+      if (!best || rank(worker) < rank(best)) {
+        best = worker;
+      }
+    }
+    return best;
+  }
+
+  _spawn(worker) {
+    worker.start().then(
+      () => {
+        worker.backoffMs = 0;
+      },
+      (error) => {
+        console.error(`Inference worker failed to start: ${error.message}`);
+        this._restart(worker);
+      }
+    );
+  }
+
+  _restart(worker, code) {
+    if (this.stopped) {
+      return;
+    }
+
+    worker.restarts++;
+    worker.backoffMs = Math.min(30000, worker.backoffMs ? worker.backoffMs * 2 : 500);
+    if (code !== undefined) {
+      console.error(`Inference worker exited with code ${code}, restarting in ${worker.backoffMs}ms`);
+    }
+
+    const timer = setTimeout(() => {
+      if (!this.stopped && !worker.ready) {
+        this._spawn(worker);
+      }
+    }, worker.backoffMs);
+    timer.unref();
+  }
+
+  async _checkHealth() {
+    if (this.checkingHealth) {
+      return;
+    }
+    this.checkingHealth = true;
+
+    await Promise.all(this.workers.map(async (worker) => {
+      // Workers still loading their model are left alone
+      if (!worker.alive) {
+        return;
+      }
+      const healthy = await worker.ping(this.healthCheckTimeoutMs);
+      if (!healthy && worker.process) {
+        console.error(`Inference worker ${worker.process.pid} failed its health check, killing it`);
+        worker.stop('SIGKILL');
+      }
+    }));
+
+    this.checkingHealth = false;
+  }
+}
+
+function rank(worker) {
+  return (worker.alive ? 0 : 1e9) + worker.load;
+}
+
+/**
+ * CPU ids for the index-th worker when each worker owns `threads` CPUs
+ */
+function cpuSlice(index, threads, cpuCount) {
+  const cpus = [];
+  for (let i = 0; i < threads; i++) {
+    cpus.push((index * threads + i) % cpuCount);
+  }
+  return cpus;
+}
+
+module.exports = WorkerPool;
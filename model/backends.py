@@ -0,0 +1,454 @@
+"""
+Optimized CPU inference backends.
+
+Every backend wraps one classifier behind the same interface: predict()
+takes a normalized float32 batch and returns (N, classes) probabilities. The
+"framework" attribute names the model family the result follows. "pytorch"
+is a torchvision model (ResNet18 by default) with NCHW ImageNet mean/std
+input. "tensorflow" is MobileNetV2 with NHWC [-1, 1] input.
+
+    eager        the framework's own model (the default)
+    torchscript  traced and frozen torchvision model
+    onnxruntime  torchvision model exported to ONNX, run with onnxruntime
+    tflite       MobileNetV2 converted to TensorFlow Lite
+    dummy        no model; infer.py's framework-free stand-in (benchmarks, CI)
+
+Optimized artifacts are exported on first use and cached in ARTIFACT_DIR.
+Later processes only load the artifact, so onnxruntime and tflite workers do
+not need torch or the Keras model at all once the cache is warm. With
+quantize="dynamic" or "static", the int8 artifact has its top-1 agreement
+with the fp32 model checked once at export time. An artifact that disagrees
+too often is rejected in favour of the fp32 one.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+from preprocess import INPUT_SIZE, normalize_batch
+
+ARTIFACT_DIR = os.environ.get(
+    "DL_MODEL_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+
+BACKENDS = ("eager", "torchscript", "onnxruntime", "tflite", "dummy")
+QUANTIZE_MODES = ("dynamic", "static")
+
+# Frames used to calibrate static quantization and to measure top-1 agreement
+CALIBRATION_FRAMES = 32
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def top_k(probabilities, k=1):
+    """
+    Class ids and scores of the k most likely classes of every row, best first,
+    as two (N, k) arrays. One argpartition over the whole batch; only the k
+    selected columns are sorted.
+    """
+    k = max(1, min(int(k), probabilities.shape[1]))
+    if k == 1:
+        idxs = probabilities.argmax(axis=1)[:, np.newaxis]
+    else:
+        candidates = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+        order = np.argsort(-np.take_along_axis(probabilities, candidates, axis=1), axis=1)
+        idxs = np.take_along_axis(candidates, order, axis=1)
+    return idxs, np.take_along_axis(probabilities, idxs, axis=1)
+
+
+class Classifier:
+    framework = None
+    top1_agreement = None
+
+    def __init__(self, backend, quantize=None, artifact=None):
+        self.backend = backend
+        self.quantize = quantize
+        self.artifact = artifact
+
+    def predict(self, batch):
+        raise NotImplementedError
+
+    def memory_bytes(self):
+        """Approximate memory held by the weights: the artifact size, or 0 if unknown."""
+        return os.path.getsize(self.artifact) if self.artifact and os.path.exists(self.artifact) else 0
+
+    def describe(self):
+        info = {"backend": self.backend, "quantize": self.quantize}
+        if self.artifact:
+            info["artifact"] = self.artifact
+        if self.top1_agreement is not None:
+            info["top1_agreement"] = self.top1_agreement
+        return info
+
+
+class TorchClassifier(Classifier):
+    """Eager or TorchScript ResNet18."""
+
+    framework = "pytorch"
+
+    def __init__(self, model, backend, quantize=None, artifact=None):
+        super().__init__(backend, quantize, artifact)
+        self.model = model
+
+    def memory_bytes(self):
+        # A frozen TorchScript module keeps its weights as constants rather than parameters
+        tensors = list(self.model.parameters()) + list(self.model.buffers())
+        if not tensors:
+            return super().memory_bytes()
+        return sum(tensor.numel() * tensor.element_size() for tensor in tensors)
+
+    def predict(self, batch):
+        import torch
+
+        with torch.no_grad():
+            output = self.model(torch.from_numpy(batch))
+            return torch.nn.functional.softmax(output, dim=1).numpy()
+
+
+class OnnxClassifier(Classifier):
+    framework = "pytorch"
+
+    def __init__(self, path, quantize=None, threads=None):
+        super().__init__("onnxruntime", quantize, path)
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        logits = self.session.run(None, {self.input_name: batch})[0]
+        return softmax(logits)
+
+
+class KerasClassifier(Classifier):
+    """Eager Keras MobileNetV2."""
+
+    framework = "tensorflow"
+
+    def __init__(self, model):
+        super().__init__("eager")
+        self.model = model
+
+    def memory_bytes(self):
+        # Keras application weights are float32
+        return self.model.count_params() * 4
+
+    def predict(self, batch):
+        import io
+        from contextlib import redirect_stdout
+
+        with io.StringIO() as buf, redirect_stdout(buf):
+            return np.asarray(self.model.predict(batch, verbose=0))
+
+
+class TfliteClassifier(Classifier):
+    framework = "tensorflow"
+
+    def __init__(self, path, quantize=None, threads=None):
+        super().__init__("tflite", quantize, path)
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.interpreter = Interpreter(model_path=path, num_threads=threads)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.batch_size = None
+
+    def predict(self, batch):
+        # The converted graph has a fixed batch dimension; resize it when the batch size changes
+        if len(batch) != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input_index, list(batch.shape))
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(batch)
+        self.interpreter.set_tensor(self.input_index, np.ascontiguousarray(batch))
+        self.interpreter.invoke()
+        return np.array(self.interpreter.get_tensor(self.output_index))
+
+
+def calibration_frames(count=CALIBRATION_FRAMES, image_dir=None, seed=0):
+    """
+    uint8 frames for calibration (seed=0) and agreement checks (seed=1).
+
+    Images from image_dir are preferred since they resemble real traffic; each
+    seed takes its own slice of the directory so the agreement check runs on
+    images the calibration did not see. Without enough images, smooth
+    synthetic scenes with sensor noise are generated instead.
+    """
+    if image_dir:
+        from preprocess import decode_rgb
+
+        names = sorted(os.listdir(image_dir))[seed * count:]
+        frames = []
+        for name in names:
+            try:
+                frames.append(decode_rgb(os.path.join(image_dir, name)))
+            except Exception:
+                continue
+            if len(frames) == count:
+                break
+        if frames:
+            return frames
+
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:INPUT_SIZE, 0:INPUT_SIZE].astype(np.float32) / INPUT_SIZE
+    frames = []
+    for _ in range(count):
+        freq = rng.uniform(1, 8, size=3)
+        phase = rng.uniform(0, 2 * np.pi, size=3)
+        channels = [128 + 100 * np.sin(freq[c] * (x * np.cos(phase[c]) + y * np.sin(phase[c])) * np.pi + phase[c])
+                    for c in range(3)]
+        frame = np.stack(channels, axis=-1) + rng.normal(0, 10, (INPUT_SIZE, INPUT_SIZE, 3))
+        frames.append(np.clip(frame, 0, 255).astype(np.uint8))
+    return frames
+
+
+def top1_agreement(candidate, reference, frames, framework):
+    batch = normalize_batch(frames, framework).copy()
+    expected = reference.predict(batch).argmax(axis=1)
+    actual = candidate.predict(batch).argmax(axis=1)
+    return float((expected == actual).mean())
+
+
+def artifact_path(name, backend, quantize, extension):
+    return os.path.join(ARTIFACT_DIR, f"{name}-{backend}-{quantize or 'fp32'}{extension}")
+
+
+def weights_fingerprint(path):
+    """Identity of the weight file an artifact is exported from, or None if there is no such file."""
+    try:
+        stat = os.stat(path)
+    except (TypeError, OSError):
+        return None
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _read_metadata(path):
+    try:
+        with open(path + ".json") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_metadata(path, metadata):
+    tmp_path = f"{path}.json.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, path + ".json")
+
+
+# Exporters write the artifact for one quantization mode to path. load_reference()
+# returns the eager fp32 model; fp32_path is the already exported fp32 artifact.
+
+def _export_torchscript(load_reference, path, quantize, frames, fp32_path):
+    import copy
+
+    import torch
+
+    example = torch.from_numpy(normalize_batch(frames[:1], "pytorch").copy())
+    model = copy.deepcopy(load_reference()).eval()
+
+    if quantize == "dynamic":
+        # Only the classifier head is Linear in ResNet18; convolutions need static quantization
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    elif quantize == "static":
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (example,))
+        with torch.no_grad():
+            for start in range(0, len(frames), 8):
+                prepared(torch.from_numpy(normalize_batch(frames[start:start + 8], "pytorch").copy()))
+        model = convert_fx(prepared)
+
+    with torch.no_grad():
+        traced = torch.jit.trace(model, example)
+        traced = torch.jit.freeze(traced)
+    torch.jit.save(traced, path)
+
+
+def _export_onnx(load_reference, path, quantize, frames, fp32_path):
+    if quantize is None:
+        import torch
+
+        example = torch.from_numpy(normalize_batch(frames[:1], "pytorch").copy())
+        torch.onnx.export(
+            load_reference().eval(), example, path,
+            input_names=["input"], output_names=["logits"],
+            dynamic_axes={"input": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=17, dynamo=False
+        )
+        return
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic, quantize_static
+
+    if quantize == "dynamic":
+        # ConvInteger kernels are slower than fp32 convolutions on CPU, so only the head is quantized
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul", "Gemm"])
+    else:
+        from onnxruntime.quantization import CalibrationDataReader
+
+        class Reader(CalibrationDataReader):
+            def __init__(self):
+                self.batches = iter([
+                    {"input": normalize_batch([frame], "pytorch").copy()} for frame in frames
+                ])
+
+            def get_next(self):
+                return next(self.batches, None)
+
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        # Fold batch norms and infer shapes first so every convolution gets quantized
+        prepared_path = path + ".prep.onnx"
+        quant_pre_process(fp32_path, prepared_path)
+        try:
+            quantize_static(prepared_path, path, Reader(),
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+        finally:
+            os.remove(prepared_path)
+
+
+def _export_tflite(load_reference, path, quantize, frames, fp32_path):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(load_reference())
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "static":
+        def representative_dataset():
+            for frame in frames:
+                yield [normalize_batch([frame], "tensorflow").copy()]
+
+        converter.representative_dataset = representative_dataset
+    with open(path, "wb") as f:
+        f.write(converter.convert())
+
+
+def _log(message):
+    print(message, file=sys.stderr)
+
+
+def load_classifier(backend="eager", quantize=None, load_pytorch_model=None,
+                    load_tensorflow_model=None, threads=None, calibration_dir=None,
+                    min_agreement=0.9, name=None, weights=None):
+    """
+    Build the classifier for a backend, exporting and caching its artifact on first use.
+
+    load_pytorch_model / load_tensorflow_model return the eager fp32 models;
+    they are only called when an artifact has to be exported or checked.
+    name keys the cached artifacts (default: resnet18 or mobilenet_v2), so
+    every registry model gets its own. weights is the file the reference
+    model is loaded from; an artifact exported from another file, or from an
+    older version of it, is exported again. Without the file, the cached
+    artifact is used as it is.
+    Returns None (the framework-free dummy classifier) for the dummy backend,
+    and for the eager backend when neither framework is installed.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend: {backend}")
+    if quantize not in (None,) + QUANTIZE_MODES:
+        raise ValueError(f"Unknown quantization mode: {quantize}")
+
+    if backend in ("eager", "dummy"):
+        if quantize:
+            raise ValueError("Quantization needs the torchscript, onnxruntime or tflite backend")
+        if backend == "dummy":
+            return None
+        if load_pytorch_model:
+            return TorchClassifier(load_pytorch_model(), "eager")
+        if load_tensorflow_model:
+            return KerasClassifier(load_tensorflow_model())
+        return None
+
+    if backend in ("torchscript", "onnxruntime"):
+        framework, load_reference = "pytorch", load_pytorch_model
+        extension = ".pt" if backend == "torchscript" else ".onnx"
+        name = name or "resnet18"
+    else:
+        framework, load_reference, extension = "tensorflow", load_tensorflow_model, ".tflite"
+        name = name or "mobilenet_v2"
+
+    def open_artifact(path, mode):
+        if backend == "torchscript":
+            import torch
+            return TorchClassifier(torch.jit.load(path), "torchscript", mode, path)
+        if backend == "onnxruntime":
+            return OnnxClassifier(path, mode, threads)
+        return TfliteClassifier(path, mode, threads)
+
+    def reference():
+        if load_reference is None:
+            raise RuntimeError(f"Exporting the {backend} artifact needs the eager {name} model")
+        return load_reference()
+
+    def export(path, mode, frames):
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        _log(f"Exporting {name} for {backend} ({mode or 'fp32'}) to {path}")
+        exporter = {"torchscript": _export_torchscript, "onnxruntime": _export_onnx,
+                    "tflite": _export_tflite}[backend]
+        # Several workers may export at once; each writes its own file and the last rename wins
+        tmp_path = f"{path}.{os.getpid()}.tmp{extension}"
+        try:
+            exporter(reference, tmp_path, mode, frames, fp32_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def stale(metadata):
+        source = weights_fingerprint(weights)
+        return source is not None and (metadata or {}).get("weights") != source
+
+    fp32_path = artifact_path(name, backend, None, extension)
+    path = artifact_path(name, backend, quantize, extension)
+    frames = None
+
+    exported = not os.path.exists(fp32_path) or stale(_read_metadata(fp32_path))
+    if exported:
+        frames = calibration_frames(image_dir=calibration_dir)
+        export(fp32_path, None, frames)
+        # Fingerprinted after the export, which may have pinned freshly downloaded weights
+        _write_metadata(fp32_path, {"model": name, "backend": backend, "quantize": None,
+                                    "weights": weights_fingerprint(weights)})
+
+    if quantize is None:
+        return open_artifact(fp32_path, None)
+
+    metadata = _read_metadata(path)
+    if not os.path.exists(path) or metadata is None or exported or stale(metadata):
+        frames = frames or calibration_frames(image_dir=calibration_dir)
+        export(path, quantize, frames)
+        # Agreement is measured on frames the calibration did not see
+        held_out = calibration_frames(image_dir=calibration_dir, seed=1)
+        agreement = top1_agreement(open_artifact(path, quantize), open_artifact(fp32_path, None),
+                                   held_out, framework)
+        metadata = {"model": name, "backend": backend, "quantize": quantize,
+                    "top1_agreement": agreement, "frames": len(held_out),
+                    "weights": weights_fingerprint(weights)}
+        _write_metadata(path, metadata)
+        _log(f"{backend} {quantize} int8 top-1 agreement with fp32: {agreement:.1%}")
+
+    if metadata["top1_agreement"] < min_agreement:
+        _log(f"{backend} {quantize} int8 agreement {metadata['top1_agreement']:.1%} is below "
+             f"{min_agreement:.0%}; using the fp32 artifact instead")
+        return open_artifact(fp32_path, None)
+
+    classifier = open_artifact(path, quantize)
+    classifier.top1_agreement = metadata["top1_agreement"]
+    return classifier
@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+
+
+class MicroBatcher:
+    """
+    Collects queued frames into one forward pass.
+
+    A batch is flushed as soon as it holds max_batch_size frames or the oldest
+    frame has waited max_wait_ms, whichever comes first. run_batch receives a
+    list of inputs and must return one result per input, in order.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._stats = {
+            "batches": 0,
+            "frames": 0,
+            "batch_sizes": {},
+            "queue_wait_ms_total": 0.0,
+            "queue_wait_ms_max": 0.0,
+            "busy_ms_total": 0.0,
+        }
+        self._created = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def submit(self, item, callback):
+        """Queue one input; callback(result, info) is called from the batch thread."""
+        self._queue.put((item, callback, time.perf_counter()))
+
+    def close(self):
+        """Run whatever is still queued, then stop the batch thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def depth(self):
+        return self._queue.qsize()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["batch_sizes"] = dict(self._stats["batch_sizes"])
+        batches = stats["batches"]
+        frames = stats["frames"]
+        stats["mean_batch_size"] = frames / batches if batches else 0.0
+        stats["mean_queue_wait_ms"] = stats["queue_wait_ms_total"] / frames if frames else 0.0
+        # Share of the batcher's lifetime spent inside run_batch
+        uptime_ms = (time.perf_counter() - self._created) * 1000.0
+        stats["uptime_ms"] = uptime_ms
+        stats["utilization"] = min(1.0, stats["busy_ms_total"] / uptime_ms) if uptime_ms else 0.0
+        stats["queue_depth"] = self.depth()
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000.0
+        return stats
+
+    def _collect(self):
+        """Return (batch, closed); closed is set once the close() sentinel is seen."""
+        first = self._queue.get()
+        if first is None:
+            return [], True
+
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if entry is None:
+                return batch, True
+            batch.append(entry)
+        return batch, False
+
+    def _loop(self):
+        closed = False
+        while not closed:
+            batch, closed = self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            waits = [(started - queued) * 1000.0 for _, _, queued in batch]
+
+            try:
+                results = self.run_batch([item for item, _, _ in batch])
+            except Exception as e:
+                results = [{"error": f"Unexpected error in inference: {str(e)}"}] * len(batch)
+            busy = (time.perf_counter() - started) * 1000.0
+
+            self._record(len(batch), waits, busy)
+
+            for (_, callback, _), result, wait in zip(batch, results, waits):
+                callback(result, {"batch_size": len(batch), "queue_wait_ms": round(wait, 3)})
+
+    def _record(self, size, waits, busy):
+        with self._lock:
+            stats = self._stats
+            stats["batches"] += 1
+            stats["frames"] += size
+            stats["batch_sizes"][size] = stats["batch_sizes"].get(size, 0) + 1
+            stats["queue_wait_ms_total"] += sum(waits)
+            stats["queue_wait_ms_max"] = max(stats["queue_wait_ms_max"], max(waits))
+            stats["busy_ms_total"] += busy
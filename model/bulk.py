@@ -0,0 +1,194 @@
+"""
+Offline bulk inference over an image directory, glob, list file or video.
+
+Frames are decoded by a thread pool ahead of the model. A bounded prefetch
+queue holds the pending decodes, so memory stays flat however long the input
+is. Decoded frames are grouped into batches of batch_size for the forward
+pass, and each batch's results are emitted in input order as soon as it
+completes.
+
+Sources:
+    directory   every image file in it, sorted by name
+    glob        e.g. "dumps/**/*.jpg" (quote it so the shell does not expand it)
+    list file   a text file with one image path per line (# starts a comment)
+    video       any file with a video extension, read frame by frame with
+                OpenCV (pip install opencv-python); multi-frame GIF/TIFF/WebP
+                files are read with PIL
+"""
+
+import glob
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageSequence
+
+from preprocess import decode_rgb
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mov", ".mkv", ".webm", ".m4v", ".mpg", ".mpeg"}
+
+_END = object()
+
+
+def _extension(path):
+    return os.path.splitext(path)[1].lower()
+
+
+def _image_frames(paths):
+    for path in paths:
+        yield {"source": path}, (lambda path=path: decode_rgb(path))
+
+
+def _list_file(path):
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                # Relative entries are relative to the list file, not the working directory
+                yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+def _video_frames(path, frame_step):
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError(f"Reading {path} needs OpenCV: pip install opencv-python")
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video: {path}")
+    fps = capture.get(cv2.CAP_PROP_FPS) or None
+    try:
+        index = 0
+        while True:
+            # grab() skips the colour conversion of frames that are stepped over
+            if not capture.grab():
+                break
+            if index % frame_step == 0:
+                ok, bgr = capture.retrieve()
+                if not ok:
+                    break
+                info = {"source": path, "frame": index}
+                if fps:
+                    info["time_s"] = round(index / fps, 3)
+                yield info, (lambda bgr=bgr: decode_rgb(Image.fromarray(bgr[..., ::-1])))
+            index += 1
+    finally:
+        capture.release()
+
+
+def _multiframe_image(path, frame_step):
+    with Image.open(path) as img:
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            if index % frame_step == 0:
+                # Copy now: the sequence iterator reuses the same image object
+                rgb = frame.convert("RGB")
+                yield {"source": path, "frame": index}, (lambda rgb=rgb: decode_rgb(rgb))
+
+
+def iter_frames(source, frame_step=1):
+    """
+    Yield (info, decode) for every frame of a source, where decode() returns
+    the (224, 224, 3) uint8 frame and info identifies it in the output.
+    """
+    frame_step = max(1, int(frame_step))
+
+    if os.path.isdir(source):
+        paths = sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if _extension(name) in IMAGE_EXTENSIONS
+        )
+        return _image_frames(paths)
+
+    if glob.has_magic(source):
+        paths = sorted(path for path in glob.glob(source, recursive=True) if os.path.isfile(path))
+        return _image_frames(paths)
+
+    if not os.path.exists(source):
+        raise FileNotFoundError(f"Source not found: {source}")
+
+    extension = _extension(source)
+    if extension in VIDEO_EXTENSIONS:
+        return _video_frames(source, frame_step)
+    if extension in IMAGE_EXTENSIONS:
+        with Image.open(source) as img:
+            if getattr(img, "n_frames", 1) > 1:
+                return _multiframe_image(source, frame_step)
+        return _image_frames([source])
+    return _image_frames(_list_file(source))
+
+
+def run_bulk(source, run_batch, emit, batch_size=16, workers=None, prefetch=None, frame_step=1):
+    """
+    Classify every frame of source and call emit(record) once per frame, in order.
+
+    record is the frame's info plus "result", or plus "error" if the frame
+    could not be decoded. At most prefetch frames (default 4 * batch_size) are
+    decoded or waiting ahead of the model at any time. Returns the number of
+    frames emitted.
+    """
+    batch_size = max(1, int(batch_size))
+    prefetch = max(batch_size, int(prefetch or 4 * batch_size))
+    frames = iter_frames(source, frame_step)
+    pending = queue.Queue(maxsize=prefetch)
+    stop = threading.Event()
+    failure = []
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+        def produce():
+            try:
+                for info, decode in frames:
+                    if stop.is_set():
+                        break
+                    # Blocks while the queue is full, bounding the decodes in flight
+                    pending.put((info, pool.submit(decode)))
+            except Exception as e:
+                failure.append(e)
+            finally:
+                pending.put(_END)
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        emitted = 0
+        done = False
+        try:
+            while not done:
+                batch = []
+                while len(batch) < batch_size:
+                    entry = pending.get()
+                    if entry is _END:
+                        done = True
+                        break
+                    batch.append(entry)
+
+                decoded = []
+                for info, future in batch:
+                    try:
+                        decoded.append((info, future.result()))
+                    except Exception as e:
+                        decoded.append((info, e))
+
+                frames_ok = [img for _, img in decoded if not isinstance(img, Exception)]
+                results = iter(run_batch(frames_ok) if frames_ok else [])
+                for info, img in decoded:
+                    if isinstance(img, Exception):
+                        emit({**info, "error": f"Error loading image: {str(img)}"})
+                    else:
+                        emit({**info, "result": next(results)})
+                    emitted += 1
+        finally:
+            # Unblock the producer if the consumer stopped early
+            stop.set()
+            while producer.is_alive():
+                try:
+                    pending.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+    if failure:
+        raise failure[0]
+    return emitted
@@ -0,0 +1,118 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def exact_key(frame):
+    """Hash of a frame's encoded bytes or decoded pixels; only identical frames share a key."""
+    if isinstance(frame, np.ndarray):
+        frame = np.ascontiguousarray(frame).tobytes()
+    return hashlib.blake2b(frame, digest_size=16).digest()
+
+
+def perceptual_key(img_array):
+    """
+    64-bit difference hash of the decoded frame.
+
+    The frame is reduced to a 9x8 grayscale thumbnail and each bit records
+    whether a pixel is brighter than its right neighbour, so sensor noise and
+    JPEG re-encoding rarely flip more than a few bits.
+    """
+    gray = img_array[..., :3].astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+    h, w = gray.shape
+    row_starts = np.linspace(0, h, 9, dtype=int)[:-1]
+    col_starts = np.linspace(0, w, 10, dtype=int)[:-1]
+    thumb = np.add.reduceat(np.add.reduceat(gray, row_starts, axis=0), col_starts, axis=1)
+    thumb /= np.outer(np.diff(np.append(row_starts, h)), np.diff(np.append(col_starts, w)))
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class ResultCache:
+    """
+    Bounded LRU cache of inference results keyed by frame content.
+
+    In "exact" mode the key is a hash of the frame's bytes as received, so a
+    repeated frame is answered before it is decoded (or of its decoded pixels
+    when it has no bytes of its own). In "perceptual" mode it is a difference
+    hash of the decoded pixels, and a lookup also matches any cached frame
+    whose hash is within max_distance bits. Entries older than ttl seconds are
+    dropped on access; ttl=None keeps them until evicted.
+    """
+
+    def __init__(self, max_entries=256, ttl=None, mode="exact", max_distance=0):
+        if mode not in ("exact", "perceptual"):
+            raise ValueError(f"Unknown cache mode: {mode}")
+        self.max_entries = max(1, int(max_entries))
+        self.ttl = ttl
+        self.mode = mode
+        self.max_distance = max_distance if mode == "perceptual" else 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def key(self, frame, namespace=""):
+        """
+        Key of a frame: its encoded bytes or its pixels in exact mode, its pixels
+        in perceptual mode. Frames only match within a namespace (e.g. the model
+        they ran on).
+        """
+        if self.mode == "perceptual":
+            return namespace, perceptual_key(frame)
+        digest = hashlib.blake2b(namespace.encode() + b"\0", digest_size=16)
+        digest.update(exact_key(frame))
+        return digest.digest()
+
+    def get(self, key, accept=None):
+        """
+        Return the cached result for key, or None on a miss. An entry that
+        accept(result) rejects counts as a miss and is left in place.
+        """
+        now = time.monotonic()
+        with self._lock:
+            match = key if key in self._entries else self._nearest(key)
+            if match is not None:
+                stored, result = self._entries[match]
+                if self.ttl is not None and now - stored > self.ttl:
+                    del self._entries[match]
+                    self._counters["expirations"] += 1
+                elif accept is None or accept(result):
+                    self._entries.move_to_end(match)
+                    self._counters["hits"] += 1
+                    return result
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_entries"] = self.max_entries
+        stats["mode"] = self.mode
+        return stats
+
+    def _nearest(self, key):
+        if not self.max_distance:
+            return None
+        namespace, bits = key
+        best, best_distance = None, self.max_distance + 1
+        for candidate in self._entries:
+            if candidate[0] != namespace:
+                continue
+            distance = bin(bits ^ candidate[1]).count("1")
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+        return best
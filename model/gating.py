@@ -0,0 +1,108 @@
+"""
+Scene-change gating for live camera streams.
+
+Consecutive frames from a mostly static camera rarely change the prediction.
+For each stream, SceneGate keeps the signature of the last frame that went
+through the model, along with its result. The signature is a 28x28 grayscale
+thumbnail of the decoded frame. A new frame is compared with it by the share
+of thumbnail blocks whose brightness moved by more than BLOCK_CHANGE. Sensor
+noise and JPEG artifacts average out within a block. An object entering a
+small part of the frame still moves every block it covers. While the share
+stays at or below the threshold and the result is younger than max_staleness
+seconds, the stored result is reused instead of running the model.
+
+Comparing with the last *inferred* frame, rather than the previous frame,
+means a slow drift still adds up and eventually triggers a fresh pass.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# 224x224 frames are averaged over 8x8 blocks
+SIGNATURE_SIZE = 28
+
+# A block counts as changed when its mean brightness moves by more than this (about 10/255)
+BLOCK_CHANGE = 0.04
+
+_GRAY = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def scene_signature(img_array):
+    """(SIGNATURE_SIZE, SIGNATURE_SIZE) float32 grayscale thumbnail in [0, 1]."""
+    h, w = img_array.shape[:2]
+    bh, bw = h // SIGNATURE_SIZE, w // SIGNATURE_SIZE
+    # Grayscale first, so the block means run over one channel instead of three
+    gray = img_array[:bh * SIGNATURE_SIZE, :bw * SIGNATURE_SIZE, :3] @ _GRAY
+    return gray.reshape(SIGNATURE_SIZE, bh, SIGNATURE_SIZE, bw).mean(axis=(1, 3)) / 255.0
+
+
+def scene_delta(a, b):
+    """Share of blocks that changed between two signatures, 0 (none) to 1 (all)."""
+    return float((np.abs(a - b) > BLOCK_CHANGE).mean())
+
+
+class SceneGate:
+    """
+    Per-stream reuse of the last result while the scene has not changed.
+
+    At most max_streams streams are tracked; the least recently seen one is
+    forgotten first. Safe to call from the request and batch threads.
+    """
+
+    def __init__(self, threshold=0.02, max_staleness=2.0, max_streams=1024):
+        # threshold: largest share of changed blocks that still counts as the same scene
+        self.threshold = float(threshold)
+        self.max_staleness = float(max_staleness)
+        self.max_streams = max(1, int(max_streams))
+        self._streams = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"reused": 0, "changed": 0, "stale": 0, "new": 0}
+
+    def check(self, stream, signature, accept=None):
+        """
+        Return (result, delta): the stored result if it can be reused, else
+        None, and the frame's difference from the last inferred frame (None
+        for a stream with no result yet). A stored result that accept(result)
+        rejects, e.g. one from another model, is treated as missing.
+        """
+        with self._lock:
+            entry = self._streams.get(stream)
+            if entry is None or (accept and not accept(entry["result"])):
+                self._counters["new"] += 1
+                return None, None
+            self._streams.move_to_end(stream)
+
+            delta = scene_delta(signature, entry["signature"])
+            if delta > self.threshold:
+                self._counters["changed"] += 1
+                return None, delta
+            if time.monotonic() - entry["time"] > self.max_staleness:
+                self._counters["stale"] += 1
+                return None, delta
+            self._counters["reused"] += 1
+            return entry["result"], delta
+
+    def update(self, stream, signature, result):
+        """Remember the result the model produced for this stream's frame."""
+        with self._lock:
+            self._streams[stream] = {"signature": signature, "result": result, "time": time.monotonic()}
+            self._streams.move_to_end(stream)
+            while len(self._streams) > self.max_streams:
+                self._streams.popitem(last=False)
+
+    def release(self, stream):
+        with self._lock:
+            self._streams.pop(stream, None)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats["streams"] = len(self._streams)
+        checked = stats["reused"] + stats["changed"] + stats["stale"]
+        stats["reuse_rate"] = stats["reused"] / checked if checked else 0.0
+        stats["threshold"] = self.threshold
+        stats["max_staleness"] = self.max_staleness
+        return stats
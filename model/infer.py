@@ -4,41 +4,249 @@ import sys
 import os
 import json
 import time
+import threading
+from base64 import b64encode
+from importlib.util import find_spec
+
 import numpy as np
-from PIL import Image
 
-try:
-    import torch
-    has_torch = True
-except ImportError:
-    has_torch = False
+from preprocess import INPUT_SIZE, decode_rgb, normalize_batch
+
+# Frameworks are only imported by the backend that uses them; importing both
+# up front cost seconds of startup even though a process only ever runs one
+has_torch = find_spec("torch") is not None
+has_tf = find_spec("tensorflow") is not None
+
+# Pinned local weight files; created from the framework's download on first use
+WEIGHTS_DIR = os.environ.get(
+    "DL_MODEL_WEIGHTS_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights")
+)
+
+# Named models, loaded on first use and reused by every frame in --serve mode; see registry.py
+_registry = None
 
-try:
-    import tensorflow as tf
-    has_tf = True
-except ImportError:
-    has_tf = False
+# Keyword arguments for load_model(), set from the command line
+_model_options = {}
 
-def load_image(image_path):
+# ImageNet class names indexed by class id, built once at import
+IMAGENET_LABELS = (
+    "tench", "goldfish", "great white shark", "tiger shark", "hammerhead shark",
+    "electric ray", "stingray", "cock", "hen", "ostrich",
+    "brambling", "goldfinch", "house finch", "junco", "indigo bunting",
+    "robin", "bulbul", "jay", "magpie", "chickadee",
+    "water ouzel", "kite", "bald eagle", "vulture", "great grey owl",
+    "European fire salamander", "common newt", "eft", "spotted salamander", "axolotl",
+    "bullfrog", "tree frog", "tailed frog", "loggerhead", "leatherback turtle",
+    "mud turtle", "terrapin", "box turtle", "banded gecko", "common iguana",
+    "American chameleon", "whiptail", "agama", "frilled lizard", "alligator lizard",
+    "Gila monster", "green lizard", "African chameleon", "Komodo dragon", "African crocodile",
+    "American alligator", "triceratops", "thunder snake", "ringneck snake", "hognose snake",
+    "green snake", "king snake", "garter snake", "water snake", "vine snake",
+    "night snake", "boa constrictor", "rock python", "Indian cobra", "green mamba",
+    "sea snake", "horned viper", "diamondback", "sidewinder", "trilobite",
+    "harvestman", "scorpion", "black and gold garden spider", "barn spider", "garden spider",
+    "black widow", "tarantula", "wolf spider", "tick", "centipede",
+    "black grouse", "ptarmigan", "ruffed grouse", "prairie chicken", "peacock",
+    "quail", "partridge", "African grey", "macaw", "sulphur-crested cockatoo",
+    "lorikeet", "coucal", "bee eater", "hornbill", "hummingbird",
+    "jacamar", "toucan", "drake", "red-breasted merganser", "goose",
+    "black swan", "tusker", "echidna", "platypus", "wallaby",
+    "koala", "wombat", "jellyfish", "sea anemone", "brain coral",
+    "flatworm", "nematode", "conch", "snail", "slug",
+    "sea slug", "chiton", "chambered nautilus", "Dungeness crab", "rock crab",
+    "fiddler crab", "king crab", "American lobster", "spiny lobster", "crayfish",
+    "hermit crab", "isopod", "white stork", "black stork", "spoonbill",
+    "flamingo", "little blue heron", "American egret", "bittern", "crane",
+    "limpkin", "European gallinule", "American coot", "bustard", "ruddy turnstone",
+    "red-backed sandpiper", "redshank", "dowitcher", "oystercatcher", "pelican",
+    "king penguin", "albatross", "grey whale", "killer whale", "dugong",
+    "sea lion", "Chihuahua", "Japanese spaniel", "Maltese dog", "Pekinese",
+    "Shih-Tzu", "Blenheim spaniel", "papillon", "toy terrier", "Rhodesian ridgeback",
+    "Afghan hound", "basset", "beagle", "bloodhound", "bluetick",
+    "black-and-tan coonhound", "Walker hound", "English foxhound", "redbone", "borzoi",
+    "Irish wolfhound", "Italian greyhound", "whippet", "Ibizan hound", "Norwegian elkhound",
+    "otterhound", "Saluki", "Scottish deerhound", "Weimaraner", "Staffordshire bullterrier",
+    "American Staffordshire terrier", "Bedlington terrier", "Border terrier", "Kerry blue terrier", "Irish terrier",
+    "Norfolk terrier", "Norwich terrier", "Yorkshire terrier", "wire-haired fox terrier", "Lakeland terrier",
+    "Sealyham terrier", "Airedale", "cairn", "Australian terrier", "Dandie Dinmont",
+    "Boston bull", "miniature schnauzer", "giant schnauzer", "standard schnauzer", "Scotch terrier",
+    "Tibetan terrier", "silky terrier", "soft-coated wheaten terrier", "West Highland white terrier", "Lhasa",
+    "flat-coated retriever", "curly-coated retriever", "golden retriever", "Labrador retriever", "Chesapeake Bay retriever",
+    "German short-haired pointer", "vizsla", "English setter", "Irish setter", "Gordon setter",
+    "Brittany spaniel", "clumber", "English springer", "Welsh springer spaniel", "cocker spaniel",
+    "Sussex spaniel", "Irish water spaniel", "kuvasz", "schipperke", "groenendael",
+    "malinois", "briard", "kelpie", "komondor", "Old English sheepdog",
+    "Shetland sheepdog", "collie", "Border collie", "Bouvier des Flandres", "Rottweiler",
+    "German shepherd", "Doberman", "miniature pinscher", "Greater Swiss Mountain dog", "Bernese mountain dog",
+    "Appenzeller", "EntleBucher", "boxer", "bull mastiff", "Tibetan mastiff",
+    "French bulldog", "Great Dane", "Saint Bernard", "Eskimo dog", "malamute",
+    "Siberian husky", "dalmatian", "affenpinscher", "basenji", "pug",
+    "Leonberg", "Newfoundland", "Great Pyrenees", "Samoyed", "Pomeranian",
+    "chow", "keeshond", "Brabancon griffon", "Pembroke", "Cardigan",
+    "toy poodle", "miniature poodle", "standard poodle", "Mexican hairless", "timber wolf",
+    "white wolf", "red wolf", "coyote", "dingo", "dhole",
+    "African hunting dog", "hyena", "red fox", "kit fox", "Arctic fox",
+    "grey fox", "tabby", "tiger cat", "Persian cat", "Siamese cat",
+    "Egyptian cat", "cougar", "lynx", "leopard", "snow leopard",
+    "jaguar", "lion", "tiger", "cheetah", "brown bear",
+    "American black bear", "ice bear", "sloth bear", "mongoose", "meerkat",
+    "tiger beetle", "ladybug", "ground beetle", "long-horned beetle", "leaf beetle",
+    "dung beetle", "rhinoceros beetle", "weevil", "fly", "bee",
+    "ant", "grasshopper", "cricket", "walking stick", "cockroach",
+    "mantis", "cicada", "leafhopper", "lacewing", "dragonfly",
+    "damselfly", "admiral", "ringlet", "monarch", "cabbage butterfly",
+    "sulphur butterfly", "lycaenid", "starfish", "sea urchin", "sea cucumber",
+    "wood rabbit", "hare", "Angora", "hamster", "porcupine",
+    "fox squirrel", "marmot", "beaver", "guinea pig", "sorrel",
+    "zebra", "hog", "wild boar", "warthog", "hippopotamus",
+    "ox", "water buffalo", "bison", "ram", "bighorn",
+    "ibex", "hartebeest", "impala", "gazelle", "Arabian camel",
+    "llama", "weasel", "mink", "polecat", "black-footed ferret",
+    "otter", "skunk", "badger", "armadillo", "three-toed sloth",
+    "orangutan", "gorilla", "chimpanzee", "gibbon", "siamang",
+    "guenon", "patas", "baboon", "macaque", "langur",
+    "colobus", "proboscis monkey", "marmoset", "capuchin", "howler monkey",
+    "titi", "spider monkey", "squirrel monkey", "Madagascar cat", "indri",
+    "Indian elephant", "African elephant", "lesser panda", "giant panda", "barracouta",
+    "eel", "coho", "rock beauty", "anemone fish", "sturgeon",
+    "gar", "lionfish", "puffer", "abacus", "abaya",
+    "academic gown", "accordion", "acoustic guitar", "aircraft carrier", "airliner",
+    "airship", "altar", "ambulance", "amphibian", "analog clock",
+    "apiary", "apron", "ashcan", "assault rifle", "backpack",
+    "bakery", "balance beam", "balloon", "ballpoint", "Band Aid",
+    "banjo", "bannister", "barbell", "barber chair", "barbershop",
+    "barn", "barometer", "barrel", "barrow", "baseball",
+    "basketball", "bassinet", "bassoon", "bathing cap", "bath towel",
+    "bathtub", "beach wagon", "beacon", "beaker", "bearskin",
+    "beer bottle", "beer glass", "bell cote", "bib", "bicycle-built-for-two",
+    "bikini", "binder", "binoculars", "birdhouse", "boathouse",
+    "bobsled", "bolo tie", "bonnet", "bookcase", "bookshop",
+    "bottlecap", "bow", "bow tie", "brass", "brassiere",
+    "breakwater", "breastplate", "broom", "bucket", "buckle",
+    "bulletproof vest", "bullet train", "butcher shop", "cab", "caldron",
+    "candle", "cannon", "canoe", "can opener", "cardigan",
+    "car mirror", "carousel", "carpenter's kit", "carton", "car wheel",
+    "cash machine", "cassette", "cassette player", "castle", "catamaran",
+    "CD player", "cello", "cellular telephone", "chain", "chainlink fence",
+    "chain mail", "chain saw", "chest", "chiffonier", "chime",
+    "china cabinet", "Christmas stocking", "church", "cinema", "cleaver",
+    "cliff dwelling", "cloak", "clog", "cocktail shaker", "coffee mug",
+    "coffeepot", "coil", "combination lock", "computer keyboard", "confectionery",
+    "container ship", "convertible", "corkscrew", "cornet", "cowboy boot",
+    "cowboy hat", "cradle", "crane", "crash helmet", "crate",
+    "crib", "Crock Pot", "croquet ball", "crutch", "cuirass",
+    "dam", "desk", "desktop computer", "dial telephone", "diaper",
+    "digital clock", "digital watch", "dining table", "dishrag", "dishwasher",
+    "disk brake", "dock", "dogsled", "dome", "doormat",
+    "drilling platform", "drum", "drumstick", "dumbbell", "Dutch oven",
+    "electric fan", "electric guitar", "electric locomotive", "entertainment center", "envelope",
+    "espresso maker", "face powder", "feather boa", "file", "fireboat",
+    "fire engine", "fire screen", "flagpole", "flute", "folding chair",
+    "football helmet", "forklift", "fountain", "fountain pen", "four-poster",
+    "freight car", "French horn", "frying pan", "fur coat", "garbage truck",
+    "gasmask", "gas pump", "goblet", "go-kart", "golf ball",
+    "golfcart", "gondola", "gong", "gown", "grand piano",
+    "greenhouse", "grille", "grocery store", "guillotine", "hair slide",
+    "hair spray", "half track", "hammer", "hamper", "hand blower",
+    "hand-held computer", "handkerchief", "hard disc", "harmonica", "harp",
+    "harvester", "hatchet", "holster", "home theater", "honeycomb",
+    "hook", "hoopskirt", "horizontal bar", "horse cart", "hourglass",
+    "iPod", "iron", "jack-o'-lantern", "jean", "jeep",
+    "jersey", "jigsaw puzzle", "jinrikisha", "joystick", "kimono",
+    "knee pad", "knot", "lab coat", "ladle", "lampshade",
+    "laptop", "lawn mower", "lens cap", "letter opener", "library",
+    "lifeboat", "lighter", "limousine", "liner", "lipstick",
+    "Loafer", "lotion", "loudspeaker", "loupe", "lumbermill",
+    "magnetic compass", "mailbag", "mailbox", "maillot", "maillot",
+    "manhole cover", "maraca", "marimba", "mask", "matchstick",
+    "maypole", "maze", "measuring cup", "medicine chest", "megalith",
+    "microphone", "microwave", "military uniform", "milk can", "minibus",
+    "miniskirt", "minivan", "missile", "mitten", "mixing bowl",
+    "mobile home", "Model T", "modem", "monastery", "monitor",
+    "moped", "mortar", "mortarboard", "mosque", "mosquito net",
+    "motor scooter", "mountain bike", "mountain tent", "mouse", "mousetrap",
+    "moving van", "muzzle", "nail", "neck brace", "necklace",
+    "nipple", "notebook", "obelisk", "oboe", "ocarina",
+    "odometer", "oil filter", "organ", "oscilloscope", "overskirt",
+    "oxcart", "oxygen mask", "packet", "paddle", "paddlewheel",
+    "padlock", "paintbrush", "pajama", "palace", "panpipe",
+    "paper towel", "parachute", "parallel bars", "park bench", "parking meter",
+    "passenger car", "patio", "pay-phone", "pedestal", "pencil box",
+    "pencil sharpener", "perfume", "Petri dish", "photocopier", "pick",
+    "pickelhaube", "picket fence", "pickup", "pier", "piggy bank",
+    "pill bottle", "pillow", "ping-pong ball", "pinwheel", "pirate",
+    "pitcher", "plane", "planetarium", "plastic bag", "plate rack",
+    "plow", "plunger", "Polaroid camera", "pole", "police van",
+    "poncho", "pool table", "pop bottle", "pot", "potter's wheel",
+    "power drill", "prayer rug", "printer", "prison", "projectile",
+    "projector", "puck", "punching bag", "purse", "quill",
+    "quilt", "racer", "racket", "radiator", "radio",
+    "radio telescope", "rain barrel", "recreational vehicle", "reel", "reflex camera",
+    "refrigerator", "remote control", "restaurant", "revolver", "rifle",
+    "rocking chair", "rotisserie", "rubber eraser", "rugby ball", "rule",
+    "running shoe", "safe", "safety pin", "saltshaker", "sandal",
+    "sarong", "sax", "scabbard", "scale", "school bus",
+    "schooner", "scoreboard", "screen", "screw", "screwdriver",
+    "seat belt", "sewing machine", "shield", "shoe shop", "shoji",
+    "shopping basket", "shopping cart", "shovel", "shower cap", "shower curtain",
+    "ski", "ski mask", "sleeping bag", "slide rule", "sliding door",
+    "slot", "snorkel", "snowmobile", "snowplow", "soap dispenser",
+    "soccer ball", "sock", "solar dish", "sombrero", "soup bowl",
+    "space bar", "space heater", "space shuttle", "spatula", "speedboat",
+    "spider web", "spindle", "sports car", "spotlight", "stage",
+    "steam locomotive", "steel arch bridge", "steel drum", "stethoscope", "stole",
+    "stone wall", "stopwatch", "stove", "strainer", "streetcar",
+    "stretcher", "studio couch", "stupa", "submarine", "suit",
+    "sundial", "sunglass", "sunglasses", "sunscreen", "suspension bridge",
+    "swab", "sweatshirt", "swimming trunks", "swing", "switch",
+    "syringe", "table lamp", "tank", "tape player", "teapot",
+    "teddy", "television", "tennis ball", "thatch", "theater curtain",
+    "thimble", "thresher", "throne", "tile roof", "toaster",
+    "tobacco shop", "toilet seat", "torch", "totem pole", "tow truck",
+    "toyshop", "tractor", "trailer truck", "tray", "trench coat",
+    "tricycle", "trimaran", "tripod", "triumphal arch", "trolleybus",
+    "trombone", "tub", "turnstile", "typewriter keyboard", "umbrella",
+    "unicycle", "upright", "vacuum", "vase", "vault",
+    "velvet", "vending machine", "vestment", "viaduct", "violin",
+    "volleyball", "waffle iron", "wall clock", "wallet", "wardrobe",
+    "warplane", "washbasin", "washer", "water bottle", "water jug",
+    "water tower", "whiskey jug", "whistle", "wig", "window screen",
+    "window shade", "Windsor tie", "wine bottle", "wing", "wok",
+    "wooden spoon", "wool", "worm fence", "wreck", "yawl",
+    "yurt", "web site", "comic book", "crossword puzzle", "street sign",
+    "traffic light", "book jacket", "menu", "plate", "guacamole",
+    "consomme", "hot pot", "trifle", "ice cream", "ice lolly",
+    "French loaf", "bagel", "pretzel", "cheeseburger", "hotdog",
+    "mashed potato", "head cabbage", "broccoli", "cauliflower", "zucchini",
+    "spaghetti squash", "acorn squash", "butternut squash", "cucumber", "artichoke",
+    "bell pepper", "cardoon", "mushroom", "Granny Smith", "strawberry",
+    "orange", "lemon", "fig", "pineapple", "banana",
+    "jackfruit", "custard apple", "pomegranate", "hay", "carbonara",
+    "chocolate sauce", "dough", "meat loaf", "pizza", "potpie",
+    "burrito", "red wine", "espresso", "cup", "eggnog",
+    "alp", "bubble", "cliff", "coral reef", "geyser",
+    "lakeside", "promontory", "sandbar", "seashore", "valley",
+    "volcano", "ballplayer", "groom", "scuba diver", "rapeseed",
+    "daisy", "yellow lady's slipper", "corn", "acorn", "hip",
+    "buckeye", "coral fungus", "agaric", "gyromitra", "stinkhorn",
+    "earthstar", "hen-of-the-woods", "bolete", "ear", "toilet tissue",
+)
+
+def load_image(source):
+    """
+    Load a frame from a file path or from in-memory encoded image bytes and
+    return it as a (224, 224, 3) uint8 RGB array.
+    """
     try:
-        img = Image.open(image_path)
-        img = img.resize((224, 224))
-        img_array = np.array(img) / 255.0
-        
-        if len(img_array.shape) == 2:
-            img_array = np.stack((img_array,) * 3, axis=-1)
-        
-        if img_array.shape[2] == 4:
-            img_array = img_array[:, :, :3]
-            
-        return img_array
+        return decode_rgb(source)
     except Exception as e:
         print(json.dumps({"error": f"Error loading image: {str(e)}"}))
         sys.exit(1)
 
 def run_inference_dummy(img_array):
-    mean_brightness = np.mean(img_array)
-    std_brightness = np.std(img_array)
+    mean_brightness = np.mean(img_array) / 255.0
+    std_brightness = np.std(img_array) / 255.0
     
     # Determine a simple "prediction" based on brightness
     if mean_brightness > 0.7:
@@ -58,327 +266,814 @@ def run_inference_dummy(img_array):
         "timestamp": time.time()
     }
 
+# Indexed by a whole (N, k) array of class ids at once
+IMAGENET_LABEL_ARRAY = np.array(IMAGENET_LABELS, dtype=object)
+
 def get_imagenet_labels():
     # Common ImageNet labels for easy reference
-    return {
-        0: "tench", 1: "goldfish", 2: "great white shark", 3: "tiger shark", 4: "hammerhead shark",
-        5: "electric ray", 6: "stingray", 7: "cock", 8: "hen", 9: "ostrich",
-        10: "brambling", 11: "goldfinch", 12: "house finch", 13: "junco", 14: "indigo bunting",
-        15: "robin", 16: "bulbul", 17: "jay", 18: "magpie", 19: "chickadee",
-        20: "water ouzel", 21: "kite", 22: "bald eagle", 23: "vulture", 24: "great grey owl",
-        25: "European fire salamander", 26: "common newt", 27: "eft", 28: "spotted salamander", 29: "axolotl",
-        30: "bullfrog", 31: "tree frog", 32: "tailed frog", 33: "loggerhead", 34: "leatherback turtle",
-        35: "mud turtle", 36: "terrapin", 37: "box turtle", 38: "banded gecko", 39: "common iguana",
-        40: "American chameleon", 41: "whiptail", 42: "agama", 43: "frilled lizard", 44: "alligator lizard",
-        45: "Gila monster", 46: "green lizard", 47: "African chameleon", 48: "Komodo dragon", 49: "African crocodile",
-        50: "American alligator", 51: "triceratops", 52: "thunder snake", 53: "ringneck snake", 54: "hognose snake",
-        55: "green snake", 56: "king snake", 57: "garter snake", 58: "water snake", 59: "vine snake",
-        60: "night snake", 61: "boa constrictor", 62: "rock python", 63: "Indian cobra", 64: "green mamba",
-        65: "sea snake", 66: "horned viper", 67: "diamondback", 68: "sidewinder", 69: "trilobite",
-        70: "harvestman", 71: "scorpion", 72: "black and gold garden spider", 73: "barn spider", 74: "garden spider",
-        75: "black widow", 76: "tarantula", 77: "wolf spider", 78: "tick", 79: "centipede",
-        80: "black grouse", 81: "ptarmigan", 82: "ruffed grouse", 83: "prairie chicken", 84: "peacock",
-        85: "quail", 86: "partridge", 87: "African grey", 88: "macaw", 89: "sulphur-crested cockatoo",
-        90: "lorikeet", 91: "coucal", 92: "bee eater", 93: "hornbill", 94: "hummingbird",
-        95: "jacamar", 96: "toucan", 97: "drake", 98: "red-breasted merganser", 99: "goose",
-        100: "black swan", 101: "tusker", 102: "echidna", 103: "platypus", 104: "wallaby",
-        105: "koala", 106: "wombat", 107: "jellyfish", 108: "sea anemone", 109: "brain coral",
-        110: "flatworm", 111: "nematode", 112: "conch", 113: "snail", 114: "slug",
-        115: "sea slug", 116: "chiton", 117: "chambered nautilus", 118: "Dungeness crab", 119: "rock crab",
-        120: "fiddler crab", 121: "king crab", 122: "American lobster", 123: "spiny lobster", 124: "crayfish",
-        125: "hermit crab", 126: "isopod", 127: "white stork", 128: "black stork", 129: "spoonbill",
-        130: "flamingo", 131: "little blue heron", 132: "American egret", 133: "bittern", 134: "crane",
-        135: "limpkin", 136: "European gallinule", 137: "American coot", 138: "bustard", 139: "ruddy turnstone",
-        140: "red-backed sandpiper", 141: "redshank", 142: "dowitcher", 143: "oystercatcher", 144: "pelican",
-        145: "king penguin", 146: "albatross", 147: "grey whale", 148: "killer whale", 149: "dugong",
-        150: "sea lion", 151: "Chihuahua", 152: "Japanese spaniel", 153: "Maltese dog", 154: "Pekinese",
-        155: "Shih-Tzu", 156: "Blenheim spaniel", 157: "papillon", 158: "toy terrier", 159: "Rhodesian ridgeback",
-        160: "Afghan hound", 161: "basset", 162: "beagle", 163: "bloodhound", 164: "bluetick",
-        165: "black-and-tan coonhound", 166: "Walker hound", 167: "English foxhound", 168: "redbone", 169: "borzoi",
-        170: "Irish wolfhound", 171: "Italian greyhound", 172: "whippet", 173: "Ibizan hound", 174: "Norwegian elkhound",
-        175: "otterhound", 176: "Saluki", 177: "Scottish deerhound", 178: "Weimaraner", 179: "Staffordshire bullterrier",
-        180: "American Staffordshire terrier", 181: "Bedlington terrier", 182: "Border terrier", 183: "Kerry blue terrier", 184: "Irish terrier",
-        185: "Norfolk terrier", 186: "Norwich terrier", 187: "Yorkshire terrier", 188: "wire-haired fox terrier", 189: "Lakeland terrier",
-        190: "Sealyham terrier", 191: "Airedale", 192: "cairn", 193: "Australian terrier", 194: "Dandie Dinmont",
-        195: "Boston bull", 196: "miniature schnauzer", 197: "giant schnauzer", 198: "standard schnauzer", 199: "Scotch terrier",
-        200: "Tibetan terrier", 201: "silky terrier", 202: "soft-coated wheaten terrier", 203: "West Highland white terrier", 204: "Lhasa",
-        205: "flat-coated retriever", 206: "curly-coated retriever", 207: "golden retriever", 208: "Labrador retriever", 209: "Chesapeake Bay retriever",
-        210: "German short-haired pointer", 211: "vizsla", 212: "English setter", 213: "Irish setter", 214: "Gordon setter",
-        215: "Brittany spaniel", 216: "clumber", 217: "English springer", 218: "Welsh springer spaniel", 219: "cocker spaniel",
-        220: "Sussex spaniel", 221: "Irish water spaniel", 222: "kuvasz", 223: "schipperke", 224: "groenendael",
-        225: "malinois", 226: "briard", 227: "kelpie", 228: "komondor", 229: "Old English sheepdog",
-        230: "Shetland sheepdog", 231: "collie", 232: "Border collie", 233: "Bouvier des Flandres", 234: "Rottweiler",
-        235: "German shepherd", 236: "Doberman", 237: "miniature pinscher", 238: "Greater Swiss Mountain dog", 239: "Bernese mountain dog",
-        240: "Appenzeller", 241: "EntleBucher", 242: "boxer", 243: "bull mastiff", 244: "Tibetan mastiff",
-        245: "French bulldog", 246: "Great Dane", 247: "Saint Bernard", 248: "Eskimo dog", 249: "malamute",
-        250: "Siberian husky", 251: "dalmatian", 252: "affenpinscher", 253: "basenji", 254: "pug",
-        255: "Leonberg", 256: "Newfoundland", 257: "Great Pyrenees", 258: "Samoyed", 259: "Pomeranian",
-        260: "chow", 261: "keeshond", 262: "Brabancon griffon", 263: "Pembroke", 264: "Cardigan",
-        265: "toy poodle", 266: "miniature poodle", 267: "standard poodle", 268: "Mexican hairless", 269: "timber wolf",
-        270: "white wolf", 271: "red wolf", 272: "coyote", 273: "dingo", 274: "dhole",
-        275: "African hunting dog", 276: "hyena", 277: "red fox", 278: "kit fox", 279: "Arctic fox",
-        280: "grey fox", 281: "tabby", 282: "tiger cat", 283: "Persian cat", 284: "Siamese cat",
-        285: "Egyptian cat", 286: "cougar", 287: "lynx", 288: "leopard", 289: "snow leopard",
-        290: "jaguar", 291: "lion", 292: "tiger", 293: "cheetah", 294: "brown bear",
-        295: "American black bear", 296: "ice bear", 297: "sloth bear", 298: "mongoose", 299: "meerkat",
-        300: "tiger beetle", 301: "ladybug", 302: "ground beetle", 303: "long-horned beetle", 304: "leaf beetle",
-        305: "dung beetle", 306: "rhinoceros beetle", 307: "weevil", 308: "fly", 309: "bee",
-        310: "ant", 311: "grasshopper", 312: "cricket", 313: "walking stick", 314: "cockroach",
-        315: "mantis", 316: "cicada", 317: "leafhopper", 318: "lacewing", 319: "dragonfly",
-        320: "damselfly", 321: "admiral", 322: "ringlet", 323: "monarch", 324: "cabbage butterfly",
-        325: "sulphur butterfly", 326: "lycaenid", 327: "starfish", 328: "sea urchin", 329: "sea cucumber",
-        330: "wood rabbit", 331: "hare", 332: "Angora", 333: "hamster", 334: "porcupine",
-        335: "fox squirrel", 336: "marmot", 337: "beaver", 338: "guinea pig", 339: "sorrel",
-        340: "zebra", 341: "hog", 342: "wild boar", 343: "warthog", 344: "hippopotamus",
-        345: "ox", 346: "water buffalo", 347: "bison", 348: "ram", 349: "bighorn",
-        350: "ibex", 351: "hartebeest", 352: "impala", 353: "gazelle", 354: "Arabian camel",
-        355: "llama", 356: "weasel", 357: "mink", 358: "polecat", 359: "black-footed ferret",
-        360: "otter", 361: "skunk", 362: "badger", 363: "armadillo", 364: "three-toed sloth",
-        365: "orangutan", 366: "gorilla", 367: "chimpanzee", 368: "gibbon", 369: "siamang",
-        370: "guenon", 371: "patas", 372: "baboon", 373: "macaque", 374: "langur",
-        375: "colobus", 376: "proboscis monkey", 377: "marmoset", 378: "capuchin", 379: "howler monkey",
-        380: "titi", 381: "spider monkey", 382: "squirrel monkey", 383: "Madagascar cat", 384: "indri",
-        385: "Indian elephant", 386: "African elephant", 387: "lesser panda", 388: "giant panda", 389: "barracouta",
-        390: "eel", 391: "coho", 392: "rock beauty", 393: "anemone fish", 394: "sturgeon",
-        395: "gar", 396: "lionfish", 397: "puffer", 398: "abacus", 399: "abaya",
-        400: "academic gown", 401: "accordion", 402: "acoustic guitar", 403: "aircraft carrier", 404: "airliner",
-        405: "airship", 406: "altar", 407: "ambulance", 408: "amphibian", 409: "analog clock",
-        410: "apiary", 411: "apron", 412: "ashcan", 413: "assault rifle", 414: "backpack",
-        415: "bakery", 416: "balance beam", 417: "balloon", 418: "ballpoint", 419: "Band Aid",
-        420: "banjo", 421: "bannister", 422: "barbell", 423: "barber chair", 424: "barbershop",
-        425: "barn", 426: "barometer", 427: "barrel", 428: "barrow", 429: "baseball",
-        430: "basketball", 431: "bassinet", 432: "bassoon", 433: "bathing cap", 434: "bath towel",
-        435: "bathtub", 436: "beach wagon", 437: "beacon", 438: "beaker", 439: "bearskin",
-        440: "beer bottle", 441: "beer glass", 442: "bell cote", 443: "bib", 444: "bicycle-built-for-two",
-        445: "bikini", 446: "binder", 447: "binoculars", 448: "birdhouse", 449: "boathouse",
-        450: "bobsled", 451: "bolo tie", 452: "bonnet", 453: "bookcase", 454: "bookshop",
-        455: "bottlecap", 456: "bow", 457: "bow tie", 458: "brass", 459: "brassiere",
-        460: "breakwater", 461: "breastplate", 462: "broom", 463: "bucket", 464: "buckle",
-        465: "bulletproof vest", 466: "bullet train", 467: "butcher shop", 468: "cab", 469: "caldron",
-        470: "candle", 471: "cannon", 472: "canoe", 473: "can opener", 474: "cardigan",
-        475: "car mirror", 476: "carousel", 477: "carpenter's kit", 478: "carton", 479: "car wheel",
-        480: "cash machine", 481: "cassette", 482: "cassette player", 483: "castle", 484: "catamaran",
-        485: "CD player", 486: "cello", 487: "cellular telephone", 488: "chain", 489: "chainlink fence",
-        490: "chain mail", 491: "chain saw", 492: "chest", 493: "chiffonier", 494: "chime",
-        495: "china cabinet", 496: "Christmas stocking", 497: "church", 498: "cinema", 499: "cleaver",
-        500: "cliff dwelling", 501: "cloak", 502: "clog", 503: "cocktail shaker", 504: "coffee mug",
-        505: "coffeepot", 506: "coil", 507: "combination lock", 508: "computer keyboard", 509: "confectionery",
-        510: "container ship", 511: "convertible", 512: "corkscrew", 513: "cornet", 514: "cowboy boot",
-        515: "cowboy hat", 516: "cradle", 517: "crane", 518: "crash helmet", 519: "crate",
-        520: "crib", 521: "Crock Pot", 522: "croquet ball", 523: "crutch", 524: "cuirass",
-        525: "dam", 526: "desk", 527: "desktop computer", 528: "dial telephone", 529: "diaper",
-        530: "digital clock", 531: "digital watch", 532: "dining table", 533: "dishrag", 534: "dishwasher",
-        535: "disk brake", 536: "dock", 537: "dogsled", 538: "dome", 539: "doormat",
-        540: "drilling platform", 541: "drum", 542: "drumstick", 543: "dumbbell", 544: "Dutch oven",
-        545: "electric fan", 546: "electric guitar", 547: "electric locomotive", 548: "entertainment center", 549: "envelope",
-        550: "espresso maker", 551: "face powder", 552: "feather boa", 553: "file", 554: "fireboat",
-        555: "fire engine", 556: "fire screen", 557: "flagpole", 558: "flute", 559: "folding chair",
-        560: "football helmet", 561: "forklift", 562: "fountain", 563: "fountain pen", 564: "four-poster",
-        565: "freight car", 566: "French horn", 567: "frying pan", 568: "fur coat", 569: "garbage truck",
-        570: "gasmask", 571: "gas pump", 572: "goblet", 573: "go-kart", 574: "golf ball",
-        575: "golfcart", 576: "gondola", 577: "gong", 578: "gown", 579: "grand piano",
-        580: "greenhouse", 581: "grille", 582: "grocery store", 583: "guillotine", 584: "hair slide",
-        585: "hair spray", 586: "half track", 587: "hammer", 588: "hamper", 589: "hand blower",
-        590: "hand-held computer", 591: "handkerchief", 592: "hard disc", 593: "harmonica", 594: "harp",
-        595: "harvester", 596: "hatchet", 597: "holster", 598: "home theater", 599: "honeycomb",
-        600: "hook", 601: "hoopskirt", 602: "horizontal bar", 603: "horse cart", 604: "hourglass",
-        605: "iPod", 606: "iron", 607: "jack-o'-lantern", 608: "jean", 609: "jeep",
-        610: "jersey", 611: "jigsaw puzzle", 612: "jinrikisha", 613: "joystick", 614: "kimono",
-        615: "knee pad", 616: "knot", 617: "lab coat", 618: "ladle", 619: "lampshade",
-        620: "laptop", 621: "lawn mower", 622: "lens cap", 623: "letter opener", 624: "library",
-        625: "lifeboat", 626: "lighter", 627: "limousine", 628: "liner", 629: "lipstick",
-        630: "Loafer", 631: "lotion", 632: "loudspeaker", 633: "loupe", 634: "lumbermill",
-        635: "magnetic compass", 636: "mailbag", 637: "mailbox", 638: "maillot", 639: "maillot",
-        640: "manhole cover", 641: "maraca", 642: "marimba", 643: "mask", 644: "matchstick",
-        645: "maypole", 646: "maze", 647: "measuring cup", 648: "medicine chest", 649: "megalith",
-        650: "microphone", 651: "microwave", 652: "military uniform", 653: "milk can", 654: "minibus",
-        655: "miniskirt", 656: "minivan", 657: "missile", 658: "mitten", 659: "mixing bowl",
-        660: "mobile home", 661: "Model T", 662: "modem", 663: "monastery", 664: "monitor",
-        665: "moped", 666: "mortar", 667: "mortarboard", 668: "mosque", 669: "mosquito net",
-        670: "motor scooter", 671: "mountain bike", 672: "mountain tent", 673: "mouse", 674: "mousetrap",
-        675: "moving van", 676: "muzzle", 677: "nail", 678: "neck brace", 679: "necklace",
-        680: "nipple", 681: "notebook", 682: "obelisk", 683: "oboe", 684: "ocarina",
-        685: "odometer", 686: "oil filter", 687: "organ", 688: "oscilloscope", 689: "overskirt",
-        690: "oxcart", 691: "oxygen mask", 692: "packet", 693: "paddle", 694: "paddlewheel",
-        695: "padlock", 696: "paintbrush", 697: "pajama", 698: "palace", 699: "panpipe",
-        700: "paper towel", 701: "parachute", 702: "parallel bars", 703: "park bench", 704: "parking meter",
-        705: "passenger car", 706: "patio", 707: "pay-phone", 708: "pedestal", 709: "pencil box",
-        710: "pencil sharpener", 711: "perfume", 712: "Petri dish", 713: "photocopier", 714: "pick",
-        715: "pickelhaube", 716: "picket fence", 717: "pickup", 718: "pier", 719: "piggy bank",
-        720: "pill bottle", 721: "pillow", 722: "ping-pong ball", 723: "pinwheel", 724: "pirate",
-        725: "pitcher", 726: "plane", 727: "planetarium", 728: "plastic bag", 729: "plate rack",
-        730: "plow", 731: "plunger", 732: "Polaroid camera", 733: "pole", 734: "police van",
-        735: "poncho", 736: "pool table", 737: "pop bottle", 738: "pot", 739: "potter's wheel",
-        740: "power drill", 741: "prayer rug", 742: "printer", 743: "prison", 744: "projectile",
-        745: "projector", 746: "puck", 747: "punching bag", 748: "purse", 749: "quill",
-        750: "quilt", 751: "racer", 752: "racket", 753: "radiator", 754: "radio",
-        755: "radio telescope", 756: "rain barrel", 757: "recreational vehicle", 758: "reel", 759: "reflex camera",
-        760: "refrigerator", 761: "remote control", 762: "restaurant", 763: "revolver", 764: "rifle",
-        765: "rocking chair", 766: "rotisserie", 767: "rubber eraser", 768: "rugby ball", 769: "rule",
-        770: "running shoe", 771: "safe", 772: "safety pin", 773: "saltshaker", 774: "sandal",
-        775: "sarong", 776: "sax", 777: "scabbard", 778: "scale", 779: "school bus",
-        780: "schooner", 781: "scoreboard", 782: "screen", 783: "screw", 784: "screwdriver",
-        785: "seat belt", 786: "sewing machine", 787: "shield", 788: "shoe shop", 789: "shoji",
-        790: "shopping basket", 791: "shopping cart", 792: "shovel", 793: "shower cap", 794: "shower curtain",
-        795: "ski", 796: "ski mask", 797: "sleeping bag", 798: "slide rule", 799: "sliding door",
-        800: "slot", 801: "snorkel", 802: "snowmobile", 803: "snowplow", 804: "soap dispenser",
-        805: "soccer ball", 806: "sock", 807: "solar dish", 808: "sombrero", 809: "soup bowl",
-        810: "space bar", 811: "space heater", 812: "space shuttle", 813: "spatula", 814: "speedboat",
-        815: "spider web", 816: "spindle", 817: "sports car", 818: "spotlight", 819: "stage",
-        820: "steam locomotive", 821: "steel arch bridge", 822: "steel drum", 823: "stethoscope", 824: "stole",
-        825: "stone wall", 826: "stopwatch", 827: "stove", 828: "strainer", 829: "streetcar",
-        830: "stretcher", 831: "studio couch", 832: "stupa", 833: "submarine", 834: "suit",
-        835: "sundial", 836: "sunglass", 837: "sunglasses", 838: "sunscreen", 839: "suspension bridge",
-        840: "swab", 841: "sweatshirt", 842: "swimming trunks", 843: "swing", 844: "switch",
-        845: "syringe", 846: "table lamp", 847: "tank", 848: "tape player", 849: "teapot",
-        850: "teddy", 851: "television", 852: "tennis ball", 853: "thatch", 854: "theater curtain",
-        855: "thimble", 856: "thresher", 857: "throne", 858: "tile roof", 859: "toaster",
-        860: "tobacco shop", 861: "toilet seat", 862: "torch", 863: "totem pole", 864: "tow truck",
-        865: "toyshop", 866: "tractor", 867: "trailer truck", 868: "tray", 869: "trench coat",
-        870: "tricycle", 871: "trimaran", 872: "tripod", 873: "triumphal arch", 874: "trolleybus",
-        875: "trombone", 876: "tub", 877: "turnstile", 878: "typewriter keyboard", 879: "umbrella",
-        880: "unicycle", 881: "upright", 882: "vacuum", 883: "vase", 884: "vault",
-        885: "velvet", 886: "vending machine", 887: "vestment", 888: "viaduct", 889: "violin",
-        890: "volleyball", 891: "waffle iron", 892: "wall clock", 893: "wallet", 894: "wardrobe",
-        895: "warplane", 896: "washbasin", 897: "washer", 898: "water bottle", 899: "water jug",
-        900: "water tower", 901: "whiskey jug", 902: "whistle", 903: "wig", 904: "window screen",
-        905: "window shade", 906: "Windsor tie", 907: "wine bottle", 908: "wing", 909: "wok",
-        910: "wooden spoon", 911: "wool", 912: "worm fence", 913: "wreck", 914: "yawl",
-        915: "yurt", 916: "web site", 917: "comic book", 918: "crossword puzzle", 919: "street sign",
-        920: "traffic light", 921: "book jacket", 922: "menu", 923: "plate", 924: "guacamole",
-        925: "consomme", 926: "hot pot", 927: "trifle", 928: "ice cream", 929: "ice lolly",
-        930: "French loaf", 931: "bagel", 932: "pretzel", 933: "cheeseburger", 934: "hotdog",
-        935: "mashed potato", 936: "head cabbage", 937: "broccoli", 938: "cauliflower", 939: "zucchini",
-        940: "spaghetti squash", 941: "acorn squash", 942: "butternut squash", 943: "cucumber", 944: "artichoke",
-        945: "bell pepper", 946: "cardoon", 947: "mushroom", 948: "Granny Smith", 949: "strawberry",
-        950: "orange", 951: "lemon", 952: "fig", 953: "pineapple", 954: "banana",
-        955: "jackfruit", 956: "custard apple", 957: "pomegranate", 958: "hay", 959: "carbonara",
-        960: "chocolate sauce", 961: "dough", 962: "meat loaf", 963: "pizza", 964: "potpie",
-        965: "burrito", 966: "red wine", 967: "espresso", 968: "cup", 969: "eggnog",
-        970: "alp", 971: "bubble", 972: "cliff", 973: "coral reef", 974: "geyser",
-        975: "lakeside", 976: "promontory", 977: "sandbar", 978: "seashore", 979: "valley",
-        980: "volcano", 981: "ballplayer", 982: "groom", 983: "scuba diver", 984: "rapeseed",
-        985: "daisy", 986: "yellow lady's slipper", 987: "corn", 988: "acorn", 989: "hip",
-        990: "buckeye", 991: "coral fungus", 992: "agaric", 993: "gyromitra", 994: "stinkhorn",
-        995: "earthstar", 996: "hen-of-the-woods", 997: "bolete", 998: "ear", 999: "toilet tissue"
-    }
+    return dict(enumerate(IMAGENET_LABELS))
 
-def run_inference_pytorch(img_array):
-    try:
-        import io
-        from contextlib import redirect_stdout
-        
-        import torchvision.transforms as transforms
-        from torchvision.models import resnet18
-        
-        transform = transforms.Compose([
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                                std=[0.229, 0.224, 0.225])
-        ])
-        
-        # Convert to torch tensor with correct data type
-        input_tensor = transform(img_array).float()
-        input_batch = input_tensor.unsqueeze(0)
-        
+def load_pytorch_model(weights=None, arch="resnet18"):
+    """
+    A torchvision classifier (ResNet18 by default) with weights from a local file.
+    
+    weights defaults to WEIGHTS_DIR/<arch>.pth. If that file does not exist
+    yet, the torchvision ImageNet weights are resolved once and pinned there,
+    so later starts skip the hub lookup. The state dict is mmap'd and assigned
+    to the model without a copy, so the weights stay clean file-backed pages:
+    every worker that loads the same file shares one copy in the page cache.
+    """
+    if weights and not os.path.exists(weights):
+        raise FileNotFoundError(f"Weights not found: {weights}")
+    
+    import io
+    from contextlib import redirect_stdout
+    
+    import torch
+    from torchvision.models import get_model
+    
+    weights = weights or os.path.join(WEIGHTS_DIR, f"{arch}.pth")
+    
+    if not os.path.exists(weights):
         with io.StringIO() as buf, redirect_stdout(buf):
-            model = resnet18(weights='DEFAULT')
+            model = get_model(arch, weights='DEFAULT')
+        pin_weights(weights, lambda path: torch.save(model.state_dict(), path))
+        if not os.path.exists(weights):
+            return model.eval()
+    
+    state = torch.load(weights, map_location="cpu", mmap=True, weights_only=True)
+    # The output layer is the last matrix; a fine-tuned checkpoint may have its own class count
+    classes = next(tensor.shape[0] for tensor in reversed(state.values()) if tensor.dim() == 2)
+    model = get_model(arch, weights=None, num_classes=classes)
+    model.load_state_dict(state, assign=True)
+    return model.eval()
+
+def load_tensorflow_model(weights=None, classes=1000):
+    """MobileNetV2 with ImageNet weights from a local file; see load_pytorch_model()."""
+    if weights and not os.path.exists(weights):
+        raise FileNotFoundError(f"Weights not found: {weights}")
+    
+    import io
+    from contextlib import redirect_stdout
+    from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2
+    
+    weights = weights or os.path.join(WEIGHTS_DIR, "mobilenet_v2.weights.h5")
+    
+    with io.StringIO() as buf, redirect_stdout(buf):
+        if os.path.exists(weights):
+            model = MobileNetV2(weights=None, classes=classes)
+            model.load_weights(weights)
+        else:
+            model = MobileNetV2(weights='imagenet')
+            pin_weights(weights, model.save_weights)
+    return model
+
+def pin_weights(path, save):
+    """Write downloaded weights to path atomically; failing to pin is not fatal."""
+    try:
+        directory, name = os.path.split(path)
+        os.makedirs(directory, exist_ok=True)
+        # Prefix rather than suffix the temp name: Keras checks the ".weights.h5" ending
+        tmp_path = os.path.join(directory, f".{os.getpid()}.{name}")
+        save(tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Could not pin weights to {path}: {str(e)}", file=sys.stderr)
+
+def run_batch_dummy(img_arrays, timings=None):
+    start = time.perf_counter_ns()
+    results = [run_inference_dummy(img_array) for img_array in img_arrays]
+    if timings is not None:
+        # The dummy classifier has no separate preprocessing step
+        timings["forward"] = time.perf_counter_ns() - start
+    return results
+
+def record_stages(timings, start, preprocessed, finished):
+    """Store the preprocess and forward durations (ns) of a batch in timings, if given."""
+    if timings is not None:
+        timings["preprocess"] = preprocessed - start
+        timings["forward"] = finished - preprocessed
+
+def format_timings(timings):
+    """Stage durations in ns -> {"<stage>_ms": ...} for the optional "timings" field."""
+    return {f"{stage}_ms": round(ns / 1e6, 3) for stage, ns in timings.items()}
+
+def get_registry():
+    """The model registry, built and its default model loaded on first use."""
+    if _registry is None:
+        load_model(**_model_options)
+    return _registry
+
+def class_labels(labels, classes):
+    """Label array for a model's output: its own labels, ImageNet's, or the class ids."""
+    if labels is not None:
+        if len(labels) != classes:
+            raise ValueError(f"The model has {classes} classes but {len(labels)} labels")
+        return labels
+    if classes == len(IMAGENET_LABEL_ARRAY):
+        return IMAGENET_LABEL_ARRAY
+    return np.arange(classes).astype(str).astype(object)
+
+def classification_results(framework, probabilities, top_k=1, probabilities_out=False, labels=None):
+    """
+    One result dict per row of (N, classes) class probabilities.
+    
+    The best class fills prediction_idx / prediction / confidence; with
+    top_k > 1, "top_k" lists the k best as {"idx", "label", "confidence"}.
+    With probabilities_out, "probabilities" holds the whole distribution as
+    base64 of packed little-endian float32 values in class order. labels
+    names the classes of a model not trained on ImageNet.
+    """
+    from backends import top_k as top_k_classes
+    
+    idxs, scores = top_k_classes(probabilities, top_k)
+    labels = class_labels(labels, probabilities.shape[1])[idxs]
+    packed = probabilities.astype("<f4", copy=False) if probabilities_out else None
+    
+    results = []
+    for row, (row_idxs, row_scores, row_labels) in enumerate(
+            zip(idxs.tolist(), scores.tolist(), labels.tolist())):
+        result = {
+            "framework": framework,
+            "prediction_idx": row_idxs[0],
+            "prediction": row_labels[0],
+            "confidence": row_scores[0],
+            "timestamp": time.time()
+        }
+        if top_k > 1:
+            result["top_k"] = [{"idx": idx, "label": label, "confidence": score}
+                               for idx, label, score in zip(row_idxs, row_labels, row_scores)]
+        if packed is not None:
+            result["probabilities"] = b64encode(packed[row].tobytes()).decode("ascii")
+        results.append(result)
+    return results
+
+def run_batch_pytorch(img_arrays, timings=None, top_k=1, probabilities=False, model=None):
+    try:
+        loaded = get_registry().get(model)
         
-        model.eval()
+        # ImageNet-normalized float32 [N,3,224,224]
+        start = time.perf_counter_ns()
+        batch = normalize_batch(img_arrays, "pytorch")
+        preprocessed = time.perf_counter_ns()
+        output = loaded.classifier.predict(batch)
+        record_stages(timings, start, preprocessed, time.perf_counter_ns())
         
-        with torch.no_grad():
-            output = model(input_batch)
-            probabilities = torch.nn.functional.softmax(output[0], dim=0)
-            
-        confidence, class_idx = torch.max(probabilities, dim=0)
+        return classification_results("pytorch", output, top_k, probabilities, loaded.labels)
+    except Exception as e:
+        return [{
+            "framework": "pytorch", 
+            "error": str(e),
+            "timestamp": time.time()
+        } for _ in img_arrays]
+
+def run_inference_pytorch(img_array):
+    return run_batch_pytorch([img_array])[0]
+
+def run_batch_tensorflow(img_arrays, timings=None, top_k=1, probabilities=False, model=None):
+    try:
+        loaded = get_registry().get(model)
         
-        # Get the class label
-        labels = get_imagenet_labels()
-        class_name = labels.get(int(class_idx.item()), "unknown")
+        # Scaled to [-1, 1] as MobileNetV2's preprocess_input does, float32 [N,224,224,3]
+        start = time.perf_counter_ns()
+        batch = normalize_batch(img_arrays, "tensorflow")
+        preprocessed = time.perf_counter_ns()
+        preds = loaded.classifier.predict(batch)
+        record_stages(timings, start, preprocessed, time.perf_counter_ns())
         
-        return {
-            "framework": "pytorch",
-            "prediction_idx": int(class_idx.item()),
-            "prediction": class_name,
-            "confidence": float(confidence.item()),
-            "timestamp": time.time()
-        }
+        # Keras ImageNet models use the same class order as IMAGENET_LABELS
+        return classification_results("tensorflow", preds, top_k, probabilities, loaded.labels)
     except Exception as e:
-        return {
-            "framework": "pytorch", 
+        return [{
+            "framework": "tensorflow",
             "error": str(e),
             "timestamp": time.time()
-        }
+        } for _ in img_arrays]
 
 def run_inference_tensorflow(img_array):
+    return run_batch_tensorflow([img_array])[0]
+
+def run_batch(img_arrays, timings=None, top_k=1, probabilities=False, model=None):
+    """
+    Classify a list of uint8 frames with a registry model.
+    
+    model names it (default: the default model); it is loaded on first use,
+    and every result carries its name in "model". If timings is a dict, it
+    receives the batch's stage durations in ns: "load" (only when this call
+    loaded the model), "preprocess" and "forward". top_k and probabilities
+    are passed to classification_results(); the dummy classifier ignores them.
+    """
+    start = time.perf_counter_ns()
+    loading = _registry is None or not _registry.is_loaded(model)
     try:
-        import io
-        from contextlib import redirect_stdout
-        
-        from tensorflow.keras.applications.mobilenet_v2 import MobileNetV2, preprocess_input
-        from tensorflow.keras.applications.mobilenet_v2 import decode_predictions
+        loaded = get_registry().get(model)
+    except Exception as e:
+        return [{"error": f"Error loading model: {str(e)}", "timestamp": time.time()} for _ in img_arrays]
+    if loading and timings is not None:
+        timings["load"] = time.perf_counter_ns() - start
+    loaded.frames += len(img_arrays)
+    
+    if loaded.framework == "pytorch":
+        results = run_batch_pytorch(img_arrays, timings, top_k, probabilities, loaded.name)
+    elif loaded.framework == "tensorflow":
+        results = run_batch_tensorflow(img_arrays, timings, top_k, probabilities, loaded.name)
+    else:
+        results = run_batch_dummy(img_arrays, timings)
+    for result in results:
+        result["model"] = loaded.name
+    return results
+
+def run_inference(img_array, timings=None, top_k=1, probabilities=False, model=None):
+    return run_batch([img_array], timings, top_k, probabilities, model)[0]
+
+def default_model_name(backend=None):
+    """The built-in model a backend runs, falling back to whichever framework is installed."""
+    if backend == "dummy":
+        return "dummy"
+    if backend == "tflite":
+        return "mobilenet_v2"
+    if backend in ("torchscript", "onnxruntime") or has_torch:
+        return "resnet18"
+    return "mobilenet_v2" if has_tf else "dummy"
+
+def model_specs(backend=None, quantize=None, weights=None, model=None, models=None):
+    """
+    The registry specs (see registry.py) and the default model's name, with
+    backend, quantize and weights applied to that model's spec.
+    """
+    from registry import load_specs
+    
+    specs = load_specs(models)
+    name = model or default_model_name(backend)
+    if name not in specs:
+        raise ValueError(f"Unknown model: {name}")
+    overrides = {"backend": backend, "quantize": quantize, "weights": weights}
+    specs[name] = {**specs[name], **{key: value for key, value in overrides.items() if value}}
+    return specs, name
+
+def default_model_spec():
+    """The spec load_model(**_model_options) gives its default model."""
+    specs, name = model_specs(**{key: _model_options.get(key)
+                                 for key in ("backend", "quantize", "weights", "model", "models")})
+    return specs[name]
+
+def load_registry_model(name, spec, threads=None, calibration_dir=None, min_agreement=0.9):
+    """Build the classifier for one registry spec (see registry.py); None for the dummy model."""
+    from functools import cache
+    
+    from backends import load_classifier
+    from registry import read_labels
+    
+    backend = spec.get("backend", "eager")
+    if backend == "dummy":
+        return None
+    
+    framework = spec.get("framework", "pytorch")
+    if framework == "pytorch":
+        if backend == "tflite":
+            raise ValueError(f"The tflite backend cannot run the PyTorch model {name}")
+        if backend == "eager" and not has_torch:
+            raise RuntimeError(f"Model {name} needs PyTorch")
+        # Exporting an int8 artifact asks for the fp32 reference more than once
+        weights = spec.get("weights") or os.path.join(WEIGHTS_DIR, f"{spec.get('arch', name)}.pth")
+        loaders = {"load_pytorch_model": cache(lambda: load_pytorch_model(spec.get("weights"),
+                                                                          spec.get("arch", name)))}
+    elif framework == "tensorflow":
+        if spec.get("arch", "mobilenet_v2") != "mobilenet_v2":
+            raise ValueError(f"Model {name}: only mobilenet_v2 is supported for TensorFlow")
+        if backend in ("torchscript", "onnxruntime"):
+            raise ValueError(f"The {backend} backend cannot run the TensorFlow model {name}")
+        if backend == "eager" and not has_tf:
+            raise RuntimeError(f"Model {name} needs TensorFlow")
+        classes = len(read_labels(spec["labels"])) if spec.get("labels") else 1000
+        weights = spec.get("weights") or os.path.join(WEIGHTS_DIR, "mobilenet_v2.weights.h5")
+        loaders = {"load_tensorflow_model": cache(lambda: load_tensorflow_model(spec.get("weights"), classes))}
+    else:
+        raise ValueError(f"Unknown framework for model {name}: {framework}")
+    
+    return load_classifier(backend, spec.get("quantize"), threads=threads,
+                           calibration_dir=calibration_dir, min_agreement=min_agreement,
+                           name=name, weights=weights, **loaders)
+
+def load_model(backend=None, quantize=None, threads=None, calibration_dir=None,
+               min_agreement=0.9, weights=None, model=None, models=None, memory_budget_mb=None):
+    """
+    Build the model registry, load its default model and return that model's
+    framework name ("pytorch", "tensorflow", or "none" for the dummy classifier).
+    
+    model names the default model (default: default_model_name(backend)), and
+    backend, quantize and weights override its spec. models is a JSON file of
+    extra named models and memory_budget_mb caps the memory of the loaded
+    ones; see registry.py. Optimized backends export and cache their artifact
+    on first use; see backends.py.
+    """
+    global _registry
+    from registry import ModelRegistry
+    
+    specs, name = model_specs(backend, quantize, weights, model, models)
+    _registry = ModelRegistry(
+        lambda name, spec: load_registry_model(name, spec, threads, calibration_dir, min_agreement),
+        specs, name, budget_mb=memory_budget_mb
+    )
+    return _registry.get().framework
+
+def configure_threads(threads=None, cpus=None, spec=None):
+    """
+    Pin this process to the given CPU ids and cap the framework's intra-op
+    thread pool, so several workers can share a machine without oversubscribing it.
+    CPUs outside the process's own affinity (e.g. a container's cpuset) are
+    left out; if none are left, the process is not pinned.
+    
+    spec is the default model's registry spec (see default_model_spec()); only
+    the framework it runs on is imported. onnxruntime and tflite take their
+    thread count from load_model() instead.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        usable = set(cpus) & os.sched_getaffinity(0)
+        try:
+            if not usable:
+                raise OSError(f"none of CPUs {sorted(cpus)} are available to this process")
+            os.sched_setaffinity(0, usable)
+        except OSError as e:
+            print(f"Could not pin to CPUs {sorted(cpus)}, not pinning: {str(e)}", file=sys.stderr)
+    
+    if not threads:
+        return
+    
+    spec = spec or {}
+    framework, backend = spec.get("framework", "pytorch"), spec.get("backend", "eager")
+    if framework == "pytorch" and backend in ("eager", "torchscript") and has_torch:
+        import torch
+        torch.set_num_threads(threads)
+    elif framework == "tensorflow" and backend == "eager" and has_tf:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+def warmup():
+    """Run one dummy frame through the whole batch path so the first real frame is not slow."""
+    run_batch([np.zeros((INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)])
+
+def read_request_image(request, payload=None):
+    """Return (img_array, None) for an infer request, or (None, error message)."""
+    if payload is not None:
+        try:
+            img_array = decode_rgb(payload, encoding=request.get("encoding", "jpeg"),
+                                   width=request.get("width"), height=request.get("height"))
+            return img_array, None
+        except Exception as e:
+            return None, f"Error loading image: {str(e)}"
+    
+    image_path = request.get("path")
+    if not image_path:
+        return None, "Please provide an image path"
+    
+    if not os.path.exists(image_path):
+        return None, f"Image not found: {image_path}"
+    
+    try:
+        return decode_rgb(image_path), None
+    except Exception as e:
+        return None, f"Error loading image: {str(e)}"
+
+def serve(max_batch_size=16, max_wait_ms=5.0, threads=None, cpus=None, cache=None, warm=False,
+          top_k=1, gate=None):
+    """
+    Long-lived worker mode: load the model once, then answer newline-delimited
+    JSON requests on stdin with one JSON line per request on stdout.
+    
+    Request:  {"id": 1, "size": 53121}\n<53121 bytes of JPEG data>
+              {"id": 2, "size": 150528, "encoding": "rgb", "width": 224, "height": 224}\n<raw RGB>
+              {"id": 3, "path": "/tmp/frame.jpg"}
+              {"id": 4, "op": "ping"}
+              {"id": 5, "op": "release", "stream": "cam-1"}
+              {"id": 6, "size": 53121, "model": "resnet50"}\n<53121 bytes of JPEG data>
+    Response: {"id": 1, "result": {...same dict as the one-shot CLI...},
+               "batch_size": 4, "queue_wait_ms": 1.2}
+    
+    The model is loaded, and with warm=True run once on a dummy frame, before
+    the ready line is written. Frames that arrive together are run as one batch of up to max_batch_size,
+    waiting at most max_wait_ms for the batch to fill. When a ResultCache is
+    given, repeated frames are answered from it without entering the batch
+    queue and their response carries "cached": true. {"op": "stats"} returns
+    the achieved batch sizes, queue wait times and cache counters. An infer
+    request with "timings": true also gets a "timings" field with the decode,
+    gate, cache, queue, preprocess, forward and serialize times in ms (preprocess and
+    forward are those of the whole batch). Results carry the top_k best
+    classes; a request may ask for fewer with "top_k": n. A request with
+    "probabilities": true also gets the full distribution as packed float32
+    (see classification_results()). With a SceneGate, an infer request that
+    names its "stream" is answered with that stream's last result while the
+    scene has not changed; the response carries "reused": true and
+    "scene_delta". {"op": "release"} forgets a stream. An infer request may
+    name any registry model with "model"; it is loaded on first use, and
+    frames for different models that share a batch run as one forward pass
+    per model. Responses to infer requests may arrive out of order; match
+    them by id.
+    """
+    from batching import MicroBatcher
+    from gating import scene_signature
+    
+    # Anything the frameworks print must not corrupt the protocol stream
+    out = sys.stdout
+    sys.stdout = sys.stderr
+    send_lock = threading.Lock()
+    
+    def send(message):
+        send_line(json.dumps(message))
+    
+    def send_line(line):
+        with send_lock:
+            out.write(line + "\n")
+            out.flush()
+    
+    def send_timed(message, result, timings):
+        # Serialize the result on its own so its cost can be reported in the same line
+        start = time.perf_counter_ns()
+        body = json.dumps(result)
+        timings["serialize"] = time.perf_counter_ns() - start
+        message["timings"] = format_timings(timings)
+        send_line(json.dumps(message)[:-1] + ', "result": ' + body + "}")
+    
+    def run_timed_batch(items):
+        # Frames for different models share the queue but not a forward pass
+        groups = {}
+        for index, (_, _, model) in enumerate(items):
+            groups.setdefault(model, []).append(index)
         
-        # Make sure image is correctly prepared for MobileNetV2
-        img_array = np.expand_dims(img_array, axis=0)
-        img_array = preprocess_input(img_array)
+        outcomes = [None] * len(items)
+        for model, indexes in groups.items():
+            # The distribution is only packed when some frame in the group asked for it
+            timings = {}
+            img_arrays = [items[index][0] for index in indexes]
+            packed = any(items[index][1] for index in indexes)
+            try:
+                results = run_batch(img_arrays, timings, top_k, packed, model)
+            except Exception as e:
+                results = [{"error": f"Unexpected error in inference: {str(e)}"}] * len(img_arrays)
+            for index, result in zip(indexes, results):
+                outcomes[index] = (result, timings)
+        return outcomes
+    
+    def usable(result, model, wants_probabilities):
+        """Whether a stored result answers a request for this model, with the distribution if asked."""
+        return result.get("model") == model and (not wants_probabilities or "probabilities" in result)
+    
+    def shape(result, k, wants_probabilities):
+        """The result as one request asked for it: at most k classes, distribution only if requested."""
+        trim = k < top_k and "top_k" in result
+        drop = not wants_probabilities and "probabilities" in result
+        if not (trim or drop):
+            return result
+        result = dict(result)
+        if trim:
+            if k > 1:
+                result["top_k"] = result["top_k"][:k]
+            else:
+                del result["top_k"]
+        if drop:
+            del result["probabilities"]
+        return result
+    
+    def send_cached(request_id, result, k, wants_probabilities, timed, stages):
+        result = shape(result, k, wants_probabilities)
+        if timed:
+            send_timed({"id": request_id, "cached": True}, result, stages)
+        else:
+            send({"id": request_id, "result": result, "cached": True})
+    
+    started = time.perf_counter()
+    try:
+        configure_threads(threads, cpus, default_model_spec())
+        framework = load_model(**_model_options)
+        if warm:
+            warmup()
+    except Exception as e:
+        send({"ready": False, "error": f"Error loading model: {str(e)}"})
+        sys.exit(1)
+    
+    batcher = MicroBatcher(run_timed_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    
+    registry = get_registry()
+    ready = {"ready": True, "framework": framework, "pid": os.getpid(),
+             "load_ms": round((time.perf_counter() - started) * 1000.0, 1)}
+    ready.update(registry.get().describe())
+    ready["models"] = sorted(registry.specs)
+    if hasattr(os, "sched_getaffinity"):
+        ready["cpus"] = sorted(os.sched_getaffinity(0))
+    send(ready)
+    
+    # Frames arrive as a JSON header line followed by "size" raw bytes on the same pipe
+    stdin = sys.stdin.buffer
+    while True:
+        line = stdin.readline()
+        if not line:
+            break
         
-        with io.StringIO() as buf, redirect_stdout(buf):
-            model = MobileNetV2(weights='imagenet')
+        line = line.strip()
+        if not line:
+            continue
         
-        with io.StringIO() as buf, redirect_stdout(buf):
-            preds = model.predict(img_array, verbose=0)
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            send({"id": None, "error": f"Invalid request: {str(e)}"})
+            continue
+        if not isinstance(request, dict):
+            send({"id": None, "error": "Invalid request: expected a JSON object"})
+            continue
         
-        decoded = decode_predictions(preds, top=1)[0][0]
-        class_name, class_desc, confidence = decoded
+        payload = None
+        size = request.get("size")
+        if size is not None and (isinstance(size, bool) or not isinstance(size, int) or size < 0):
+            send({"id": request.get("id"), "error": f"Invalid size: {size!r}"})
+            continue
+        if size:
+            payload = stdin.read(size)
+            if len(payload) < size:
+                break
         
-        # Use ImageNet labels for consistency with PyTorch model
-        try:
-            idx = int(class_name.split('_')[1])
-            labels = get_imagenet_labels()
-            class_name_from_dict = labels.get(idx, class_desc)
-            prediction = class_name_from_dict
-        except:
-            prediction = class_desc
+        request_id = request.get("id")
+        op = request.get("op", "infer")
         
-        return {
-            "framework": "tensorflow",
-            "prediction_id": class_name,
-            "prediction": prediction,
-            "confidence": float(confidence),
-            "timestamp": time.time()
-        }
+        if op == "ping":
+            send({"id": request_id, "pong": True})
+        elif op == "stats":
+            stats = {"batching": batcher.stats(), "models": registry.stats()}
+            if cache:
+                stats["cache"] = cache.stats()
+            if gate:
+                stats["gating"] = gate.stats()
+            send({"id": request_id, "stats": stats})
+        elif op == "release":
+            if gate:
+                gate.release(request.get("stream"))
+            send({"id": request_id, "released": True})
+        elif op == "infer":
+            timed = bool(request.get("timings"))
+            wants_probabilities = bool(request.get("probabilities"))
+            try:
+                k = min(top_k, max(1, int(request.get("top_k") or top_k)))
+            except (TypeError, ValueError, OverflowError):
+                send({"id": request_id, "error": f"Invalid top_k: {request.get('top_k')}"})
+                continue
+            try:
+                model = registry.resolve(request.get("model"))
+            except KeyError as e:
+                send({"id": request_id, "error": e.args[0]})
+                continue
+            # A model that just failed to load is not queued, so its frames don't hold up a batch
+            load_error = registry.failure(model)
+            if load_error is not None:
+                send({"id": request_id, "error": f"Error loading model: {load_error}"})
+                continue
+            start = time.perf_counter_ns()
+            stages = {}
+            stream = request.get("stream") if gate else None
+            
+            # An exact cache keys the frame on the bytes received, so a repeated frame skips its decode;
+            # raw pixels also depend on the dimensions they are read with. A gated stream needs the
+            # pixels first, so its frames are looked up after the gate.
+            cache_key = None
+            if cache and cache.mode == "exact" and payload is not None:
+                frame_format = f"{request.get('encoding', 'jpeg')}:{request.get('width')}x{request.get('height')}"
+                cache_key = cache.key(payload, f"{model}\0{frame_format}")
+                if stream is None:
+                    result = cache.get(cache_key, accept=lambda result: usable(result, model, wants_probabilities))
+                    stages["cache"] = time.perf_counter_ns() - start
+                    if result is not None:
+                        send_cached(request_id, result, k, wants_probabilities, timed, stages)
+                        continue
+                start = time.perf_counter_ns()
+            
+            img_array, error = read_request_image(request, payload)
+            if error:
+                send({"id": request_id, "error": error})
+                continue
+            decoded = time.perf_counter_ns()
+            stages["decode"] = decoded - start
+            
+            signature = None
+            if stream is not None:
+                signature = scene_signature(img_array)
+                result, delta = gate.check(stream, signature,
+                                           accept=lambda result: usable(result, model, wants_probabilities))
+                stages["gate"] = time.perf_counter_ns() - decoded
+                if result is not None:
+                    reused = {"id": request_id, "reused": True, "scene_delta": round(delta, 4)}
+                    result = shape(result, k, wants_probabilities)
+                    if timed:
+                        send_timed(reused, result, stages)
+                    else:
+                        send({**reused, "result": result})
+                    continue
+                decoded = time.perf_counter_ns()
+            
+            if cache and "cache" not in stages:
+                cache_key = cache_key or cache.key(img_array, model)
+                # A cached result only serves a distribution request if it was stored with one
+                result = cache.get(cache_key, accept=lambda result: usable(result, model, wants_probabilities))
+                stages["cache"] = time.perf_counter_ns() - decoded
+                if result is not None:
+                    if signature is not None:
+                        gate.update(stream, signature, result)
+                    send_cached(request_id, result, k, wants_probabilities, timed, stages)
+                    continue
+            
+            def reply(outcome, info, request_id=request_id, cache_key=cache_key,
+                      timed=timed, stages=stages, k=k, wants_probabilities=wants_probabilities,
+                      stream=stream, signature=signature):
+                result, timings = outcome
+                if cache_key is not None and "error" not in result:
+                    cache.put(cache_key, result)
+                if signature is not None and "error" not in result:
+                    gate.update(stream, signature, result)
+                result = shape(result, k, wants_probabilities)
+                if timed:
+                    stages["queue"] = int(info["queue_wait_ms"] * 1e6)
+                    stages.update(timings)
+                    send_timed({"id": request_id, **info}, result, stages)
+                else:
+                    send({"id": request_id, "result": result, **info})
+            
+            batcher.submit((img_array, wants_probabilities, model), reply)
+        else:
+            send({"id": request_id, "error": f"Unknown op: {op}"})
+    
+    batcher.close()
+
+def process_bulk(source, batch_size=16, workers=None, prefetch=None, frame_step=1, output=None,
+                 top_k=1):
+    """
+    Classify every frame of a directory, glob, list file or video and write one
+    JSON line per frame, in input order, as each batch completes:
+    
+        {"source": "dumps/0001.jpg", "result": {...same dict as the one-shot CLI...}}
+        {"source": "clip.mp4", "frame": 30, "time_s": 1.0, "result": {...}}
+    
+    See bulk.py for the decode pipeline.
+    """
+    from bulk import run_bulk
+    
+    # Anything the frameworks print must not end up between the JSON lines
+    out = open(output, "w") if output else sys.stdout
+    sys.stdout = sys.stderr
+    
+    try:
+        configure_threads(_model_options.get("threads"), None, default_model_spec())
+        load_model(**_model_options)
     except Exception as e:
-        return {
-            "framework": "tensorflow",
-            "error": str(e),
-            "timestamp": time.time()
-        }
+        out.write(json.dumps({"error": f"Error loading model: {str(e)}"}) + "\n")
+        sys.exit(1)
+    
+    def emit(record):
+        out.write(json.dumps(record) + "\n")
+        out.flush()
+    
+    try:
+        run_bulk(source, lambda img_arrays: run_batch(img_arrays, top_k=top_k), emit,
+                 batch_size=batch_size, workers=workers,
+                 prefetch=prefetch, frame_step=frame_step)
+    except Exception as e:
+        emit({"error": str(e)})
+        sys.exit(1)
+    finally:
+        if output:
+            out.close()
+
+def parse_cpu_list(value):
+    cpus = set()
+    for part in value.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cpus.update(range(int(start), int(end) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+def parse_args(argv):
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run image classification on a frame")
+    parser.add_argument("image_path", nargs="?",
+                        help="Image to classify (one-shot mode); '-' reads the image bytes from stdin")
+    parser.add_argument("--serve", action="store_true",
+                        help="Run as a long-lived worker reading JSON requests from stdin")
+    parser.add_argument("--max-batch-size", type=int, default=16,
+                        help="Largest batch the --serve worker (or --bulk run) puts in one forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0,
+                        help="How long the --serve worker waits for a batch to fill")
+    parser.add_argument("--threads", type=int,
+                        help="Intra-op threads for the framework (torch.set_num_threads)")
+    parser.add_argument("--cpus", type=parse_cpu_list,
+                        help="Comma-separated CPU ids to pin the worker to, e.g. 0,1 or 0-3")
+    parser.add_argument("--cache-size", type=int, default=0,
+                        help="Cache results for up to this many distinct frames (0 disables the cache)")
+    parser.add_argument("--cache-ttl", type=float,
+                        help="Seconds a cached result stays valid (default: until evicted)")
+    parser.add_argument("--cache-mode", choices=["exact", "perceptual"], default="exact",
+                        help="Key the cache on exact pixels or on a perceptual hash")
+    parser.add_argument("--cache-distance", type=int, default=4,
+                        help="Max differing hash bits for a perceptual cache hit")
+    parser.add_argument("--scene-threshold", type=float, default=0.02,
+                        help="Share of changed 8x8 blocks below which a --serve stream reuses its last result")
+    parser.add_argument("--max-staleness", type=float, default=2.0,
+                        help="Seconds a --serve stream may reuse a result before the model runs again")
+    parser.add_argument("--backend", choices=["eager", "torchscript", "onnxruntime", "tflite", "dummy"],
+                        help="Inference backend of the default model (default: eager; optimized "
+                             "backends export a cached artifact; dummy needs no framework)")
+    parser.add_argument("--quantize", choices=["dynamic", "static"],
+                        help="Use an int8 artifact (needs a non-eager backend)")
+    parser.add_argument("--weights",
+                        help="Local weight file for the default model (default: pinned copy in model/weights/)")
+    parser.add_argument("--model",
+                        help="Default model, by registry name (default: resnet18, or mobilenet_v2 / "
+                             "dummy when the backend or the installed frameworks call for it)")
+    parser.add_argument("--models",
+                        help="JSON file of extra named models a request can select (see registry.py)")
+    parser.add_argument("--memory-budget-mb", type=float,
+                        help="Evict the least recently used models when the loaded ones take more memory")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Run one dummy batch before the --serve worker reports ready")
+    parser.add_argument("--calibration-dir",
+                        help="Images for static quantization and the int8 agreement check")
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="Lowest int8 vs fp32 top-1 agreement before falling back to fp32")
+    parser.add_argument("--top-k", type=int, default=1,
+                        help="Report the k most likely classes (one vectorized selection per batch)")
+    parser.add_argument("--probabilities", action="store_true",
+                        help="Add the full class distribution as base64 packed float32 to the one-shot result")
+    parser.add_argument("--timings", action="store_true",
+                        help="Add per-stage times in ms to the one-shot result")
+    parser.add_argument("--bulk", metavar="SOURCE",
+                        help="Classify every frame of a directory, glob, list file or video as JSON Lines")
+    parser.add_argument("--decode-workers", type=int,
+                        help="Threads decoding --bulk frames (default: CPU count)")
+    parser.add_argument("--prefetch", type=int,
+                        help="Most --bulk frames decoded ahead of the model (default: 4 batches)")
+    parser.add_argument("--frame-step", type=int, default=1,
+                        help="Classify every Nth frame of a --bulk video")
+    parser.add_argument("--output", help="Write --bulk results to this file instead of stdout")
+    return parser.parse_args(argv)
 
 def main():
     try:
         sys.stdout.flush()
         
-        if len(sys.argv) != 2:
+        args = parse_args(sys.argv[1:])
+        
+        _model_options.update(backend=args.backend, quantize=args.quantize, threads=args.threads,
+                              calibration_dir=args.calibration_dir, min_agreement=args.min_agreement,
+                              weights=args.weights, model=args.model, models=args.models,
+                              memory_budget_mb=args.memory_budget_mb)
+        
+        if args.serve:
+            cache = None
+            if args.cache_size > 0:
+                from cache import ResultCache
+                cache = ResultCache(max_entries=args.cache_size, ttl=args.cache_ttl,
+                                    mode=args.cache_mode, max_distance=args.cache_distance)
+            
+            from gating import SceneGate
+            gate = SceneGate(threshold=args.scene_threshold, max_staleness=args.max_staleness)
+            
+            serve(max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+                  threads=args.threads, cpus=args.cpus, cache=cache, warm=args.warmup,
+                  top_k=args.top_k, gate=gate)
+            return
+        
+        if args.bulk:
+            process_bulk(args.bulk, batch_size=args.max_batch_size, workers=args.decode_workers,
+                         prefetch=args.prefetch, frame_step=args.frame_step, output=args.output,
+                         top_k=args.top_k)
+            return
+        
+        if not args.image_path:
             print(json.dumps({"error": "Please provide an image path"}))
             sys.exit(1)
         
-        image_path = sys.argv[1]
+        image_path = args.image_path
         
-        if not os.path.exists(image_path):
+        start = time.perf_counter_ns()
+        if image_path == "-":
+            img_array = load_image(sys.stdin.buffer.read())
+        elif not os.path.exists(image_path):
             print(json.dumps({"error": f"Image not found: {image_path}"}))
             sys.exit(1)
+        else:
+            img_array = load_image(image_path)
+        timings = {"decode": time.perf_counter_ns() - start}
         
-        img_array = load_image(image_path)
+        result = run_inference(img_array, timings, args.top_k, args.probabilities)
         
-        if has_torch:
-            result = run_inference_pytorch(img_array)
-        elif has_tf:
-            result = run_inference_tensorflow(img_array)
-        else:
-            result = run_inference_dummy(img_array)
+        start = time.perf_counter_ns()
+        output = json.dumps(result)
+        if args.timings:
+            timings["serialize"] = time.perf_counter_ns() - start
+            output = json.dumps({**result, "timings": format_timings(timings)})
         
         sys.stdout.flush()
-        print(json.dumps(result))
+        print(output)
     except Exception as e:
         print(json.dumps({"error": f"Unexpected error in inference: {str(e)}"}))
         sys.exit(1)
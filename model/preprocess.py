@@ -0,0 +1,131 @@
+"""
+Frame preprocessing shared by every inference backend.
+
+Frames stay uint8 from decode to resize. A single float32 multiply-add then
+normalizes them straight into a preallocated batch buffer in the layout the
+backend expects. JPEGs are decoded at reduced scale with PIL's draft() when the
+source is much larger than the model input, which skips most of the IDCT work
+for 720p/1080p camera frames.
+"""
+
+import io
+
+import numpy as np
+from PIL import Image
+
+INPUT_SIZE = 224
+
+# Per-backend normalization as a fused uint8 -> float32 scale and bias per channel
+#   pytorch:    (x / 255 - mean) / std           (torchvision ImageNet weights)
+#   tensorflow: x / 127.5 - 1                    (keras mobilenet_v2.preprocess_input)
+#   none:       x / 255                          (brightness statistics)
+_IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+_IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+NORMALIZATION = {
+    "pytorch": {
+        "layout": "NCHW",
+        "scale": 1.0 / (255.0 * _IMAGENET_STD),
+        "bias": -_IMAGENET_MEAN / _IMAGENET_STD,
+    },
+    "tensorflow": {
+        "layout": "NHWC",
+        "scale": np.full(3, 1.0 / 127.5, dtype=np.float32),
+        "bias": np.full(3, -1.0, dtype=np.float32),
+    },
+    "none": {
+        "layout": "NHWC",
+        "scale": np.full(3, 1.0 / 255.0, dtype=np.float32),
+        "bias": np.zeros(3, dtype=np.float32),
+    },
+}
+
+
+def open_image(source, encoding="jpeg", width=None, height=None):
+    """
+    Open a frame as a PIL image without decoding its pixels yet.
+
+    source is a file path, a PIL image, or a bytes-like object holding encoded
+    image data. With encoding="rgb" it is a packed width*height*3 RGB buffer.
+    """
+    if isinstance(source, Image.Image):
+        return source
+
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if encoding == "rgb":
+            if not width or not height:
+                raise ValueError("Raw RGB frames need a width and height")
+            if len(source) != width * height * 3:
+                raise ValueError(f"Expected {width * height * 3} bytes of RGB data, got {len(source)}")
+            return Image.frombuffer("RGB", (width, height), source, "raw", "RGB", 0, 1)
+        return Image.open(io.BytesIO(source))
+
+    return Image.open(source)
+
+
+def decode_rgb(source, size=INPUT_SIZE, encoding="jpeg", width=None, height=None):
+    """Decode a frame to a (size, size, 3) uint8 RGB array."""
+    img = open_image(source, encoding, width, height)
+
+    # Let the JPEG decoder downscale by 1/2, 1/4 or 1/8 while staying >= size
+    if img.format == "JPEG":
+        img.draft("RGB", (size, size))
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+
+    if img.size != (size, size):
+        img = img.resize((size, size), Image.BICUBIC)
+
+    return np.asarray(img, dtype=np.uint8)
+
+
+class BatchBuffer:
+    """
+    Reusable float32 input buffer for one backend.
+
+    fill() normalizes a list of uint8 HWC frames into the first N slots and
+    returns that view, so steady-state batches allocate nothing.
+    """
+
+    def __init__(self, backend, size=INPUT_SIZE, capacity=1):
+        params = NORMALIZATION[backend]
+        self.layout = params["layout"]
+        self.size = size
+        if self.layout == "NCHW":
+            self.scale = params["scale"].reshape(3, 1, 1)
+            self.bias = params["bias"].reshape(3, 1, 1)
+        else:
+            self.scale = params["scale"]
+            self.bias = params["bias"]
+        self._buffer = None
+        self._reserve(capacity)
+
+    def _reserve(self, capacity):
+        if self._buffer is not None and len(self._buffer) >= capacity:
+            return
+        if self.layout == "NCHW":
+            shape = (capacity, 3, self.size, self.size)
+        else:
+            shape = (capacity, self.size, self.size, 3)
+        self._buffer = np.empty(shape, dtype=np.float32)
+
+    def fill(self, frames):
+        self._reserve(len(frames))
+        batch = self._buffer[:len(frames)]
+        for out, frame in zip(batch, frames):
+            if self.layout == "NCHW":
+                frame = frame.transpose(2, 0, 1)
+            np.multiply(frame, self.scale, out=out)
+            out += self.bias
+        return batch
+
+
+_buffers = {}
+
+
+def normalize_batch(frames, backend):
+    """Normalize uint8 HWC frames into the backend's shared batch buffer."""
+    if backend not in _buffers:
+        _buffers[backend] = BatchBuffer(backend, capacity=len(frames))
+    return _buffers[backend].fill(frames)
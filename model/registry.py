@@ -0,0 +1,223 @@
+"""
+Named models, loaded on first use and evicted least recently used first.
+
+A worker serves its default model to every request, and any other model in
+the registry to a request that names it with "model". A model is loaded the
+first time a frame asks for it, so adding one to the registry costs nothing
+until it is used. When the loaded models take more than budget_mb, the least
+recently used ones are dropped until they fit again. The model being fetched
+is never dropped. A model that was evicted is loaded again by its next frame.
+A model that fails to load is not tried again for a while (RETRY_S, doubling
+up to RETRY_MAX_S); until then its frames get the same error straight away.
+
+Specs come from BUILTIN_MODELS, extended or overridden by a JSON file:
+
+    {
+      "resnet50": {},
+      "resnet18": {"backend": "onnxruntime", "quantize": "dynamic"},
+      "parts": {"arch": "resnet18", "weights": "/models/parts.pth", "labels": "/models/parts.txt"}
+    }
+
+    framework   "pytorch" (any torchvision classification model) or "tensorflow"
+                (MobileNetV2 only); default "pytorch"
+    arch        torchvision model name; defaults to the entry's name
+    weights     state dict (.pth) or Keras weights (.weights.h5); default: the
+                pinned ImageNet weights of arch
+    labels      text file with one class name per line; default: ImageNet
+    backend     see backends.py; default "eager"
+    quantize    "dynamic" or "static" int8, for non-eager backends
+
+Loading itself is the caller's load(name, spec) function; it returns the
+classifier, or None for the dummy model.
+"""
+
+import gc
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+BUILTIN_MODELS = {
+    "resnet18": {"framework": "pytorch", "arch": "resnet18"},
+    "mobilenet_v2": {"framework": "tensorflow", "arch": "mobilenet_v2"},
+    "dummy": {"backend": "dummy"},
+}
+
+SPEC_KEYS = {"framework", "arch", "weights", "labels", "backend", "quantize"}
+
+RETRY_S = 1.0
+RETRY_MAX_S = 60.0
+
+
+def load_specs(path=None):
+    """BUILTIN_MODELS, with the entries of a JSON registry file merged over them."""
+    specs = {name: dict(spec) for name, spec in BUILTIN_MODELS.items()}
+    if not path:
+        return specs
+
+    with open(path) as f:
+        extra = json.load(f)
+    if not isinstance(extra, dict):
+        raise ValueError(f"{path} must hold an object of model name -> spec")
+
+    base = os.path.dirname(os.path.abspath(path))
+    for name, spec in extra.items():
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            raise ValueError(f"Unknown keys for model {name}: {', '.join(sorted(unknown))}")
+        spec = dict(spec)
+        # Relative files are relative to the registry file, not the working directory
+        for key in ("weights", "labels"):
+            if spec.get(key) and not os.path.isabs(spec[key]):
+                spec[key] = os.path.join(base, spec[key])
+        specs[name] = {**specs.get(name, {}), **spec}
+    return specs
+
+
+def read_labels(path):
+    with open(path) as f:
+        return np.array([line.strip() for line in f if line.strip()], dtype=object)
+
+
+class LoadedModel:
+    def __init__(self, name, spec, classifier, load_ms):
+        self.name = name
+        self.spec = spec
+        self.classifier = classifier
+        self.framework = classifier.framework if classifier else "none"
+        self.labels = read_labels(spec["labels"]) if spec.get("labels") else None
+        self.nbytes = classifier.memory_bytes() if classifier else 0
+        self.load_ms = load_ms
+        self.frames = 0
+        self.last_used = time.monotonic()
+
+    def describe(self):
+        info = {"model": self.name, "framework": self.framework}
+        if self.classifier:
+            info.update(self.classifier.describe())
+        return info
+
+
+class ModelRegistry:
+    """
+    Loaded models by name, in least recently used order.
+
+    get() loads on the calling thread; in --serve mode that is the batch
+    thread, which is also the only thread running models, so a model is
+    never evicted in the middle of its batch.
+    """
+
+    def __init__(self, load, specs, default, budget_mb=None):
+        if default not in specs:
+            raise ValueError(f"Unknown model: {default}")
+        self.load = load
+        self.specs = specs
+        self.default = default
+        self.budget = int(budget_mb * 1024 * 1024) if budget_mb else None
+        self._loaded = OrderedDict()
+        # Sizes of models seen before, so room can be made before one is loaded again
+        self._sizes = {}
+        # name -> (error message, monotonic time of the next attempt, current delay)
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._counters = {"loads": 0, "evictions": 0, "load_failures": 0}
+
+    def resolve(self, name=None):
+        """The registry name a request's "model" refers to; raises KeyError for unknown ones."""
+        name = name or self.default
+        if not isinstance(name, str):
+            raise KeyError(f"Invalid model: {json.dumps(name)}")
+        if name not in self.specs:
+            raise KeyError(f"Unknown model: {name}")
+        return name
+
+    def is_loaded(self, name=None):
+        with self._lock:
+            return (name or self.default) in self._loaded
+
+    def failure(self, name=None):
+        """The error of name's last load while it is waiting to be retried, else None."""
+        with self._lock:
+            failure = self._failures.get(name or self.default)
+        if failure is None or time.monotonic() >= failure[1]:
+            return None
+        return failure[0]
+
+    def get(self, name=None):
+        """
+        The LoadedModel for name (default: the default model), loading it if needed.
+        Raises the load error, or RuntimeError with its message while the load
+        is waiting to be retried.
+        """
+        name = self.resolve(name)
+        with self._lock:
+            model = self._loaded.get(name)
+            if model is not None:
+                self._loaded.move_to_end(name)
+                model.last_used = time.monotonic()
+                return model
+        error = self.failure(name)
+        if error is not None:
+            raise RuntimeError(error)
+
+        self._evict(self._sizes.get(name, 0), keep=name)
+        start = time.perf_counter()
+        try:
+            classifier = self.load(name, self.specs[name])
+            model = LoadedModel(name, self.specs[name], classifier, (time.perf_counter() - start) * 1000.0)
+        except Exception as e:
+            with self._lock:
+                delay = min(self._failures[name][2] * 2, RETRY_MAX_S) if name in self._failures else RETRY_S
+                self._failures[name] = (str(e), time.monotonic() + delay, delay)
+                self._counters["load_failures"] += 1
+            print(f"Could not load model {name}, retrying in {delay:.0f} s: {str(e)}", file=sys.stderr)
+            raise
+
+        with self._lock:
+            self._failures.pop(name, None)
+            self._loaded[name] = model
+            self._sizes[name] = model.nbytes
+            self._counters["loads"] += 1
+        self._evict(0, keep=name)
+        return model
+
+    def _evict(self, incoming, keep):
+        if self.budget is None:
+            return
+        evicted = []
+        with self._lock:
+            used = sum(model.nbytes for model in self._loaded.values())
+            for name in list(self._loaded):
+                if used + incoming <= self.budget:
+                    break
+                if name == keep or not self._loaded[name].nbytes:
+                    continue
+                used -= self._loaded[name].nbytes
+                evicted.append(self._loaded.pop(name))
+                self._counters["evictions"] += 1
+        if evicted:
+            print(f"Evicted {', '.join(model.name for model in evicted)} to stay within "
+                  f"the {self.budget / 2 ** 20:.0f} MB model budget", file=sys.stderr)
+            # Drop the last references now so the memory is returned before the next load
+            del evicted
+            gc.collect()
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            loaded = [{**model.describe(), "bytes": model.nbytes, "load_ms": round(model.load_ms, 1),
+                       "frames": model.frames, "idle_s": round(now - model.last_used, 1)}
+                      for model in self._loaded.values()]
+            stats = dict(self._counters)
+            stats["failed"] = [{"model": name, "error": error, "retry_in_s": round(max(0.0, retry_at - now), 1)}
+                               for name, (error, retry_at, _) in self._failures.items()]
+        stats["default"] = self.default
+        stats["available"] = sorted(self.specs)
+        stats["loaded"] = loaded
+        stats["bytes"] = sum(model["bytes"] for model in loaded)
+        stats["budget_bytes"] = self.budget
+        return stats
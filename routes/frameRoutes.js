@@ -3,9 +3,12 @@ const router = express.Router();
 const frameController = require('../controllers/frameController');
 
 router.post('/frame', frameController.handleFrameUpload);
+router.post('/frames', frameController.handleFrameStream);
 
 router.get('/status', (req, res) => {
   res.json({ status: 'ok', message: 'Deep learning model server is running' });
 });
 
+router.get('/metrics', frameController.handleMetrics);
+
 module.exports = router;
\ No newline at end of file
@@ -3,6 +3,9 @@ const http = require('http');
 const WebSocket = require('ws');
 const cors = require('cors');
 const frameRoutes = require('./routes/frameRoutes');
+const frameController = require('./controllers/frameController');
+const FrameQueue = require('./lib/frameQueue');
+const { encodeBinaryResult } = require('./lib/resultEncoding');
 
 const app = express();
 app.use(cors());
@@ -15,41 +18,81 @@ app.use('/api', frameRoutes);
 
 const server = http.createServer(app);
 
-const wss = new WebSocket.Server({ server });
+const wss = new WebSocket.Server({ server, maxPayload: 50 * 1024 * 1024 });
+
+// Per-connection backpressure: frames in flight, and newest frames kept waiting for a slot
+const WS_MAX_IN_FLIGHT = parseInt(process.env.WS_MAX_IN_FLIGHT, 10) || 1;
+const WS_MAX_QUEUED = process.env.WS_MAX_QUEUED !== undefined ? parseInt(process.env.WS_MAX_QUEUED, 10) : 1;
+
+let connections = 0;
 
 wss.on('connection', (ws) => {
   console.log('Client connected');
+  
+  // Scene-change state is kept per connection, for clients that send skip_static
+  const stream = `ws-${++connections}`;
 
-  ws.on('message', async (message) => {
+  // Raw messages are queued and only parsed once they get a slot, so dropped frames cost nothing
+  const frames = new FrameQueue(async (message) => {
     try {
       const frameData = JSON.parse(message);
       
-      const frameController = require('./controllers/frameController');
-      const result = await frameController.processFrame(frameData.frame);
+      const result = await frameController.processFrame(frameData.frame, {
+        timings: frameData.timings,
+        topK: frameData.top_k,
+        probabilities: frameData.probabilities,
+        stream: frameData.skip_static ? stream : undefined,
+        model: frameData.model
+      });
       
       // Enhance the result with a more user-friendly message
       let detectedObject = result.prediction || "unknown object";
       let confidence = result.confidence ? (result.confidence * 100).toFixed(2) + "%" : "unknown";
       
-      ws.send(JSON.stringify({ 
+      const response = { 
         status: 'success',
         message: `Detected: ${detectedObject} (Confidence: ${confidence})`,
-        data: result 
-      }));
+        data: result,
+        frames: frames.stats()
+      };
+      
+      // The full distribution goes out as packed float32 instead of a JSON string when asked
+      if (frameData.format === 'binary' && result.probabilities) {
+        sendRaw(ws, encodeBinaryResult(response));
+      } else {
+        send(ws, response);
+      }
     } catch (error) {
       console.error('Error processing frame:', error);
-      ws.send(JSON.stringify({ 
+      send(ws, { 
         status: 'error', 
-        message: error.message 
-      }));
+        message: error.message,
+        frames: frames.stats()
+      });
     }
+  }, { maxInFlight: WS_MAX_IN_FLIGHT, maxQueued: WS_MAX_QUEUED });
+
+  ws.on('message', (message) => {
+    frames.push(message);
   });
 
   ws.on('close', () => {
+    frames.close();
+    frameController.releaseStream(stream);
     console.log('Client disconnected');
   });
 });
 
+function send(ws, message) {
+  sendRaw(ws, JSON.stringify(message));
+}
+
+function sendRaw(ws, data) {
+  if (ws.readyState === WebSocket.OPEN) {
+    ws.send(data);
+  }
+}
+
 // Start the server
 const PORT = process.env.PORT || 3000;
 server.listen(PORT, () => {